@@ -2,16 +2,13 @@ import os
 import sys
 import argparse
 import logging
-import shutil
-from src.video_processing import (
-    extract_frames, 
-    get_video_hash, 
-    is_youtube_url,
-    download_youtube_video,
-    convert_to_mp4
-)
-from src.gemini_analysis import analyze_frames_with_gemini, analyze_video_with_gemini
-from src.report_generation import create_output_directory, save_reports
+from src.video_processing import DEFAULT_SCENE_THRESHOLD, FRAME_BACKENDS, SAMPLERS, check_time_range, parse_time
+from src.gemini_analysis import ANALYSIS_MODES, GEMINI_MODELS
+from src.pipeline import run_pipeline
+from src.service import serve
+from src.gemini_client import DEFAULT_MAX_RETRIES
+from src.jobs import load_manifest
+from src.report_index import DEFAULT_INDEX_PATH
 
 def setup_logging():
     """Configures logging to file and console."""
@@ -24,19 +21,18 @@ def setup_logging():
         ]
     )
 
-def main():
-    """Main function to orchestrate the video analysis process."""
-    setup_logging()
-    
+def build_parser():
+    """Returns the command-line argument parser."""
     parser = argparse.ArgumentParser(
         description="A research-grade tool to analyze human behavior in videos using Gemini AI.",
         formatter_class=argparse.RawTextHelpFormatter
     )
-    parser.add_argument("video_inputs", nargs='+', help="Local paths or YouTube URLs of the videos to analyze.")
+    parser.add_argument("video_inputs", nargs='*', help="Local paths or YouTube URLs of the videos to analyze.")
+    parser.add_argument("--manifest", type=str, default=None, help="JSONL or CSV file listing inputs ('input' field) with optional per-input options, analyzed after any inputs given on the command line.")
     
     parser.add_argument(
         "-m", "--model", 
-        choices=['gemini-1.5-flash', 'gemini-1.5-pro', 'gemini-2.5-flash', 'gemini-2.5-pro'],
+        choices=GEMINI_MODELS,
         default='gemini-2.5-pro',
         help='''The Gemini model to use for analysis.
 - gemini-1.5-flash: Fast and cost-effective.
@@ -47,7 +43,7 @@ def main():
     
     parser.add_argument(
         "--analysis-mode",
-        choices=['frames', 'video'],
+        choices=ANALYSIS_MODES,
         default='video',
         help='''The method for analysis.
 - frames: Extracts frames as images and analyzes them visually.
@@ -55,71 +51,118 @@ def main():
     )
     
     parser.add_argument("-i", "--interval", type=int, default=1, help="Interval in seconds between frame captures (only used in 'frames' mode).")
-    parser.add_argument("-f", "--focus", type=str, default=None, help="Specify the focus of the analysis (e.g., 'the person on the left').")
-    parser.add_argument("-l", "--language", type=str, default=None, help="The output language for the analysis report (e.g., 'Spanish').")
-
-    args = parser.parse_args()
-
-    logging.info("--- Starting new analysis run ---")
-    logging.info(f"Command line arguments: {vars(args)}")
-
-    for video_input in args.video_inputs:
-        logging.info(f"--- Processing input: {video_input} ---")
-        
-        processed_video_path = None
-        original_filename = ""
-
-        if os.path.exists(video_input):
-            logging.info("Input is a local file.")
-            processed_video_path = video_input
-            original_filename = os.path.basename(video_input)
-        elif is_youtube_url(video_input):
-            logging.info("Input is a YouTube URL. Starting download...")
-            downloaded_path = download_youtube_video(video_input)
-            if downloaded_path:
-                original_filename = os.path.basename(downloaded_path)
-                processed_video_path = convert_to_mp4(downloaded_path)
-        else:
-            logging.error(f"Input '{video_input}' is not a valid file path or YouTube URL. Skipping.")
-            continue
+    parser.add_argument(
+        "--sampler",
+        choices=SAMPLERS,
+        default='auto',
+        help='''How frames are sampled in 'frames' mode.
+- auto: (Default) Seeks for long intervals, grabs sequentially otherwise.
+- grab: Walks every frame but only decodes the sampled ones to images.
+- seek: Jumps directly to each sampled frame.'''
+    )
+    parser.add_argument(
+        "--frame-backend",
+        choices=FRAME_BACKENDS,
+        default='opencv',
+        help='''How frames are extracted in 'frames' mode.
+- opencv: (Default) Decodes frames with OpenCV and encodes them in Python.
+- ffmpeg: Lets ffmpeg select, scale and JPEG-encode frames in its own threads. Falls back to opencv if ffmpeg is not installed.'''
+    )
+    parser.add_argument("--extract-workers", type=int, default=1, help="Number of processes that decode and encode frames in parallel in 'frames' mode (default: 1, extract in-process).")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="Maximum number of encoded frames buffered ahead of request assembly in 'frames' mode (0 disables background extraction).")
+    parser.add_argument("--window", type=float, default=0, help="Split 'frames' mode analysis into windows of this many seconds, analyzed concurrently and merged into one report (0 sends all frames in a single request).")
+    parser.add_argument("--window-workers", type=int, default=4, help="Maximum number of window requests in flight when --window is set.")
+    parser.add_argument("--dedup", type=int, nargs='?', const=5, default=None, metavar="BITS", help="Drop sampled frames whose 64-bit difference hash is within BITS bits of the last kept frame (default when given: 5). Disabled by default.")
+    parser.add_argument("--scene-threshold", type=float, default=DEFAULT_SCENE_THRESHOLD, help="Histogram distance (0-1) above which a frame is treated as a scene change and always kept when --dedup is set.")
+    parser.add_argument("--max-request-mb", type=float, default=None, help="Payload budget per Gemini request in 'frames' mode, in megabytes. Frame size, JPEG quality and, if needed, the interval are chosen to fit.")
+    parser.add_argument("--max-request-tokens", type=int, default=None, help="Estimated image-token budget per Gemini request in 'frames' mode.")
+    parser.add_argument("--start", type=parse_time, default=None, help="Only analyze the video from this time on, in seconds or [HH:]MM:SS.")
+    parser.add_argument("--end", type=parse_time, default=None, help="Only analyze the video up to this time, in seconds or [HH:]MM:SS.")
+    parser.add_argument("--segment", type=float, default=0, help="In 'video' mode, split the video into segments of about this many seconds (stream copy, no re-encoding), analyze them in parallel and merge the results (0 disables).")
+    parser.add_argument("--segment-workers", type=int, default=4, help="Maximum number of segments uploaded or analyzed concurrently when --segment is set.")
+    parser.add_argument(
+        "--ffmpeg-preset",
+        choices=['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow'],
+        default='medium',
+        help="x264 preset used when a downloaded video has to be re-encoded. Compatible H.264/AAC streams are remuxed without re-encoding."
+    )
+    parser.add_argument("--ffmpeg-threads", type=int, default=0, help="Threads per ffmpeg conversion (0 lets ffmpeg decide).")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of videos processed concurrently.")
+    parser.add_argument("--download-workers", type=int, default=2, help="Maximum concurrent YouTube downloads when --jobs > 1.")
+    parser.add_argument("--convert-workers", type=int, default=os.cpu_count() or 1, help="Maximum concurrent ffmpeg conversions when --jobs > 1.")
+    parser.add_argument("--analysis-workers", type=int, default=4, help="Maximum videos in the Gemini analysis stage (extraction, upload and generation) when --jobs > 1.")
+    parser.add_argument("--stream", action="store_true", help="Stream the Gemini response into analysis.md as it is generated, with progress in status.json (single focus/language runs without --window or --segment).")
+    parser.add_argument("--rpm", type=int, default=None, help="Maximum Gemini requests per minute per model, shared by all concurrent work (default: unlimited).")
+    parser.add_argument("--tpm", type=int, default=None, help="Maximum Gemini tokens per minute per model, shared by all concurrent work (default: unlimited).")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES, help="Retries for a Gemini request (generation, file upload and status, deletion, context caching) that fails with a rate limit, server error or timeout.")
+    parser.add_argument("--job-db", type=str, default=os.path.join(".cache", "jobs.sqlite"), help="SQLite database recording the status and stages of every input, used by --resume.")
+    parser.add_argument("--resume", action="store_true", help="Skip inputs that already completed with the same options in a previous run recorded in --job-db.")
+    parser.add_argument("--report-index", type=str, default=DEFAULT_INDEX_PATH, help="SQLite index of all saved reports (hash, model, parameters, sentiment, confidence, observations), updated as reports are saved. Query it with 'python -m src.report_index'.")
+    parser.add_argument("--no-report-index", action="store_true", help="Do not update the report index.")
+    parser.add_argument("--metrics-jsonl", type=str, default=None, help="Append per-video stage spans (duration, bytes, frames, token usage) to this JSON Lines file.")
+    parser.add_argument("--metrics-prom", type=str, default=None, help="Write per-stage totals to this Prometheus textfile (for the node_exporter textfile collector), updated after every video.")
+    parser.add_argument("--profile", type=str, default=None, metavar="INPUT", help="Profile the processing of this input (as given on the command line or in the manifest) with cProfile.")
+    parser.add_argument("--profile-memory", action="store_true", help="With --profile, also trace memory allocations with tracemalloc.")
+    parser.add_argument("--profile-dir", type=str, default="profiles", help="Directory for --profile output.")
+    parser.add_argument("--serve", action="store_true", help="Run as a long-lived service: accept inputs over an HTTP API and process them with --jobs warm workers (see README).")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address the --serve API listens on.")
+    parser.add_argument("--port", type=int, default=8765, help="Port the --serve API listens on.")
+    parser.add_argument("--socket", type=str, default=None, help="Serve the --serve API on this Unix domain socket instead of host and port.")
+    parser.add_argument("--cache-dir", type=str, default=os.path.join(".cache", "results"), help="Directory of the analysis result cache.")
+    parser.add_argument("--cache-max-mb", type=float, default=500, help="Size limit of the result cache in megabytes; least recently used entries are evicted beyond it (0 for no limit).")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write the result cache.")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached results and call Gemini again, updating the cache.")
+    parser.add_argument("--media-cache-dir", type=str, default=os.path.join(".cache", "media"), help="Directory of the persistent cache of downloaded and converted YouTube videos, keyed by video ID.")
+    parser.add_argument("--media-cache-max-gb", type=float, default=20, help="Size limit of the media cache in gigabytes; least recently used videos are evicted beyond it (0 for no limit).")
+    parser.add_argument("--no-media-cache", action="store_true", help="Download YouTube videos again instead of using the media cache.")
+    parser.add_argument("--hash-cache", type=str, default=os.path.join(".cache", "hashes.json"), help="File recording video hashes by path, size, modification time and inode, so unchanged files are not hashed again.")
+    parser.add_argument("--keep-uploads", action="store_true", help="Keep uploaded videos on Gemini until they expire and record them in --upload-registry, so later runs in 'video' mode reuse them. By default each upload is deleted as soon as its analyses are done.")
+    parser.add_argument("--upload-registry", type=str, default=os.path.join(".cache", "uploads.json"), help="File mapping video hashes to uploaded Gemini files kept with --keep-uploads.")
+    parser.add_argument("--upload-timeout", type=float, default=600, help="Seconds to wait for an uploaded video to finish server-side processing.")
+    parser.add_argument("-f", "--focus", type=str, action="append", default=None, help="Specify the focus of the analysis (e.g., 'the person on the left'). Repeat to analyze the same video for several subjects.")
+    parser.add_argument("-l", "--language", type=str, action="append", default=None, help="The output language for the analysis report (e.g., 'Spanish'). Repeat to produce reports in several languages.")
+    parser.add_argument("--variant-workers", type=int, default=4, help="Maximum concurrent requests when several --focus/--language values are given.")
+    return parser
 
-        if not processed_video_path:
-            logging.error(f"Failed to acquire or process video from '{video_input}'. Skipping.")
-            continue
+def main():
+    """Main function to orchestrate the video analysis process."""
+    setup_logging()
 
-        video_hash = get_video_hash(processed_video_path)
-        if not video_hash:
-            logging.warning(f"Could not hash video {original_filename}. Skipping.")
-            continue
-        logging.info(f"SHA256 Hash for {original_filename}: {video_hash}")
+    parser = build_parser()
+    args = parser.parse_args()
 
-        analysis_md, analysis_json = None, None
-        if args.analysis_mode == 'frames':
-            frames = extract_frames(processed_video_path, args.interval)
-            if frames:
-                analysis_md, analysis_json = analyze_frames_with_gemini(frames, args.model, args.focus, args.language)
-            else:
-                logging.warning(f"Frame extraction failed for {original_filename}. Skipping.")
-                continue
-        elif args.analysis_mode == 'video':
-            analysis_md, analysis_json = analyze_video_with_gemini(processed_video_path, args.model, args.focus, args.language)
+    try:
+        check_time_range(args.start, args.end)
+    except ValueError as e:
+        parser.error(f"Invalid --start/--end: {e}")
+    if args.interval < 1:
+        parser.error(f"--interval must be at least 1 (got {args.interval})")
 
-        if not analysis_md:
-            logging.warning(f"Gemini analysis failed for {original_filename}. Skipping report generation.")
-            continue
+    items = [(video_input, {}) for video_input in args.video_inputs]
+    if args.manifest:
+        try:
+            items += load_manifest(args.manifest)
+        except (OSError, ValueError) as e:
+            parser.error(f"Could not read manifest: {e}")
+    for video_input, overrides in items:
+        try:
+            check_time_range(overrides.get("start", args.start), overrides.get("end", args.end))
+        except ValueError as e:
+            parser.error(f"Invalid time range for '{video_input}': {e}")
+    if not items and not args.serve:
+        parser.error("No inputs given. Pass video paths or URLs, or --manifest.")
 
-        output_dir = create_output_directory("reports", original_filename, args.model)
-        if not output_dir:
-            logging.error(f"Could not create output directory for {original_filename}. Skipping report generation.")
-            continue
-        
-        logging.info(f"Saving reports to: {output_dir}")
-        save_reports(output_dir, analysis_md, analysis_json, original_filename)
+    if args.serve:
+        logging.info("--- Starting analysis service ---")
+        logging.info(f"Command line arguments: {vars(args)}")
+        serve(args, items)
+        logging.info("--- Analysis service stopped ---")
+        return
 
-    if os.path.exists("temp"):
-        shutil.rmtree("temp")
-        logging.info("Cleaned up temporary directory.")
+    logging.info("--- Starting new analysis run ---")
+    logging.info(f"Command line arguments: {vars(args)}")
 
+    run_pipeline(items, args)
     logging.info("--- Analysis run finished ---")
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+"""
+Compares frame sampling strategies for extract_frames on synthetic videos.
+
+Usage:
+    python -m benchmarks.bench_extract_frames --duration 60 --fps 60 --interval 1 5 --workers 4
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+import tempfile
+
+import cv2
+
+os.environ.setdefault("TQDM_DISABLE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_synthetic_video
+from src.video_processing import extract_frames, iter_frames
+
+def extract_frames_read_all(video_path, interval_sec=1):
+    """The original loop: decodes every frame with cap.read() and keeps one per interval."""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    frame_interval = max(1, int(fps * interval_sec))
+    frames = []
+    frame_count = 0
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame_count % frame_interval == 0:
+            _, buffer = cv2.imencode('.jpg', frame)
+            frames.append(buffer.tobytes())
+        frame_count += 1
+    cap.release()
+    return frames
+
+def time_run(fn, total_frames, repeat):
+    """Returns (best seconds, source frames/sec, frames kept) over `repeat` runs."""
+    best = None
+    kept = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        kept = len(fn())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, total_frames / best, kept
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark frame sampling strategies.")
+    parser.add_argument("--duration", type=float, default=30, help="Synthetic video length in seconds.")
+    parser.add_argument("--fps", type=int, default=60, help="Synthetic video frame rate.")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--interval", type=float, nargs='+', default=[1, 5], help="Sampling intervals to test, in seconds.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, nargs='*', default=[], help="Also time process-parallel extraction with these worker counts.")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = make_synthetic_video(
+            os.path.join(tmp, "synthetic.mp4"), args.duration, args.fps, args.width, args.height
+        )
+        total_frames = int(args.duration * args.fps)
+        print(f"Synthetic video: {args.duration}s @ {args.fps} fps, {args.width}x{args.height} ({total_frames} frames)")
+        print(f"{'interval':>8}  {'strategy':<10} {'seconds':>8} {'frames/sec':>11} {'kept':>5}")
+        for interval in args.interval:
+            candidates = [
+                ("read-all", lambda: extract_frames_read_all(video_path, interval)),
+                ("grab", lambda: extract_frames(video_path, interval, sampler='grab')),
+                ("seek", lambda: extract_frames(video_path, interval, sampler='seek')),
+            ]
+            for workers in args.workers:
+                candidates.append((f"auto x{workers}", lambda workers=workers: list(iter_frames(video_path, interval, workers=workers))))
+            for name, fn in candidates:
+                seconds, fps, kept = time_run(fn, total_frames, args.repeat)
+                print(f"{interval:>8}  {name:<10} {seconds:>8.2f} {fps:>11.0f} {kept:>5}")
+
+if __name__ == "__main__":
+    main()
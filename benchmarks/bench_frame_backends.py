@@ -0,0 +1,83 @@
+"""
+Compares the OpenCV and ffmpeg frame extraction backends for throughput and
+peak memory. Each run happens in a fresh subprocess so that peak RSS is
+measured per backend: the Python process itself, and its largest child (the
+ffmpeg process for the ffmpeg backend).
+
+Usage:
+    python -m benchmarks.bench_frame_backends --duration 60 --fps 30 --interval 1 --max-side 768
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import resource
+import subprocess
+import tempfile
+
+os.environ.setdefault("TQDM_DISABLE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_synthetic_video
+from src.video_processing import ffmpeg_available, iter_frames
+
+def run_one(video_path, backend, interval, max_side):
+    """Extracts all frames with one backend and prints its timings as JSON."""
+    logging.disable(logging.INFO)
+    start = time.perf_counter()
+    frames = 0
+    total_bytes = 0
+    for _, jpeg in iter_frames(video_path, interval, max_side=max_side, backend=backend):
+        frames += 1
+        total_bytes += len(jpeg)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux.
+    print(json.dumps({
+        "seconds": elapsed,
+        "frames": frames,
+        "bytes": total_bytes,
+        "python_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark frame extraction backends.")
+    parser.add_argument("--duration", type=float, default=30, help="Synthetic video length in seconds.")
+    parser.add_argument("--fps", type=int, default=30, help="Synthetic video frame rate.")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--interval", type=float, default=1, help="Sampling interval in seconds.")
+    parser.add_argument("--max-side", type=int, default=None, help="Downscale frames so their longer side is at most this many pixels.")
+    parser.add_argument("--run-one", nargs=2, metavar=("VIDEO", "BACKEND"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(args.run_one[0], args.run_one[1], args.interval, args.max_side)
+        return
+
+    if not ffmpeg_available():
+        print("ffmpeg was not found on the PATH; only the OpenCV backend will be measured.")
+    backends = ['opencv', 'ffmpeg'] if ffmpeg_available() else ['opencv']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = make_synthetic_video(
+            os.path.join(tmp, "synthetic.mp4"), args.duration, args.fps, args.width, args.height
+        )
+        total_frames = int(args.duration * args.fps)
+        print(f"Synthetic video: {args.duration}s @ {args.fps} fps, {args.width}x{args.height} ({total_frames} frames), interval {args.interval}s")
+        print(f"{'backend':<8} {'seconds':>8} {'frames/sec':>11} {'kept':>5} {'MB out':>7} {'python RSS MB':>14} {'child RSS MB':>13}")
+        for backend in backends:
+            command = [sys.executable, "-m", "benchmarks.bench_frame_backends", "--interval", str(args.interval), "--run-one", video_path, backend]
+            if args.max_side:
+                command += ["--max-side", str(args.max_side)]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{backend:<8} {result['seconds']:>8.2f} {total_frames / result['seconds']:>11.0f} {result['frames']:>5} "
+                f"{result['bytes'] / 1e6:>7.1f} {result['python_rss_mb']:>14.0f} {result['child_rss_mb']:>13.0f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+End-to-end benchmark of the analyzer pipeline, offline. It generates synthetic
+videos, then runs analyzer.main() on them against the local Gemini stand-in in
+benchmarks/fake_genai.py, which simulates upload, server-side processing and
+generation latency and a configurable rate of 429 responses. It reports
+videos/hour, per-stage latency percentiles (from the --metrics-jsonl spans)
+and peak memory.
+
+Arguments after `--` are passed to the analyzer unchanged, e.g. to compare
+concurrency settings:
+    python -m benchmarks.bench_pipeline --videos 8 --duration 20 -- --jobs 4 --window 5
+    python -m benchmarks.bench_pipeline --videos 4 --mode video --error-rate 0.2 -- --segment 10
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import resource
+import tempfile
+
+os.environ.setdefault("TQDM_DISABLE", "1")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import fake_genai
+from benchmarks.synthetic import make_synthetic_video
+
+PERCENTILES = (50, 90, 99)
+
+def percentile(sorted_values, p):
+    """Returns the p-th percentile of an ascending list, by linear interpolation."""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+def read_spans(metrics_path):
+    """Returns the span and video records of a --metrics-jsonl file."""
+    spans, videos = [], []
+    with open(metrics_path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            (spans if record["type"] == "span" else videos).append(record)
+    return spans, videos
+
+def print_stage_table(spans, videos):
+    """Prints per-stage latency percentiles, and per-video wall time, in seconds."""
+    by_stage = {}
+    for record in spans:
+        by_stage.setdefault(record["stage"], []).append(record["duration_sec"])
+    by_stage["video (total)"] = [record["duration_sec"] for record in videos]
+    header = "".join(f"{f'p{p}':>9}" for p in PERCENTILES)
+    print(f"{'stage':<15} {'count':>6}{header} {'max':>8} {'total':>9}")
+    for stage, durations in by_stage.items():
+        if not durations:
+            continue
+        durations.sort()
+        columns = "".join(f"{percentile(durations, p):>9.3f}" for p in PERCENTILES)
+        print(f"{stage:<15} {len(durations):>6}{columns} {durations[-1]:>8.3f} {sum(durations):>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the full analyzer pipeline offline against a simulated Gemini backend.",
+        epilog="Arguments after '--' are passed to analyzer.py.",
+    )
+    parser.add_argument("--videos", type=int, default=4, help="Number of synthetic videos.")
+    parser.add_argument("--duration", type=float, default=20, help="Synthetic video length in seconds.")
+    parser.add_argument("--fps", type=int, default=30, help="Synthetic video frame rate.")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--mode", choices=["frames", "video"], default="frames", help="Analyzer --analysis-mode.")
+    parser.add_argument("--upload-base-sec", type=float, default=0.1, help="Simulated fixed latency of a file upload.")
+    parser.add_argument("--upload-sec-per-mb", type=float, default=0.05, help="Simulated upload time per megabyte.")
+    parser.add_argument("--processing-sec", type=float, default=2.0, help="Simulated server-side processing time of an uploaded video.")
+    parser.add_argument("--generation-sec", type=float, default=2.0, help="Simulated generation latency of a request (jittered).")
+    parser.add_argument("--jitter", type=float, default=0.25, help="Relative jitter of the generation latency (0.25 = +/-25%%).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of generation requests rejected with a 429.")
+    parser.add_argument("--retry-after-sec", type=float, default=1.0, help="Retry delay suggested in simulated 429 responses.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the simulated latency jitter and errors.")
+    parser.add_argument("--verbose", action="store_true", help="Show the analyzer's log output.")
+    args, analyzer_args = parser.parse_known_args()
+    analyzer_args = [a for a in analyzer_args if a != "--"]
+
+    stats = fake_genai.install(fake_genai.FakeGeminiConfig(
+        upload_sec_per_mb=args.upload_sec_per_mb, upload_base_sec=args.upload_base_sec,
+        processing_sec=args.processing_sec, generation_sec=args.generation_sec,
+        generation_jitter=args.jitter, error_rate=args.error_rate,
+        retry_after_sec=args.retry_after_sec, seed=args.seed,
+    ))
+    os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+    import analyzer
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        started = time.perf_counter()
+        videos = [
+            make_synthetic_video(os.path.join(tmp, "videos", f"synthetic_{i}.mp4"), args.duration, args.fps, args.width, args.height, seed=i + 1)
+            for i in range(args.videos)
+        ]
+        generate_sec = time.perf_counter() - started
+        total_mb = sum(os.path.getsize(v) for v in videos) / 1e6
+        print(f"Generated {args.videos} synthetic videos ({args.duration}s @ {args.fps} fps, {args.width}x{args.height}, {total_mb:.1f} MB) in {generate_sec:.1f}s")
+
+        metrics_path = os.path.join(tmp, "metrics.jsonl")
+        sys.argv = ["analyzer.py", *videos, "--analysis-mode", args.mode, "--metrics-jsonl", metrics_path, "--no-cache", *analyzer_args]
+        print(f"Running: {' '.join(sys.argv[args.videos + 1:])}")
+        if not args.verbose:
+            logging.disable(logging.WARNING)
+        started = time.perf_counter()
+        analyzer.main()
+        elapsed = time.perf_counter() - started
+        logging.disable(logging.NOTSET)
+
+        spans, video_records = read_spans(metrics_path)
+        done = sum(1 for record in video_records if record["status"] == "done")
+        print()
+        print(f"{done}/{args.videos} videos completed in {elapsed:.2f}s: {done / elapsed * 3600:.0f} videos/hour")
+        print_stage_table(spans, video_records)
+        counts = stats.counts
+        print()
+        print(
+            f"Simulated backend: {counts['requests']} generation requests ({counts['rate_limited']} rate-limited), "
+            f"{counts['images']} images, {counts['uploads']} uploads ({counts['upload_bytes'] / 1e6:.1f} MB), "
+            f"{counts['file_polls']} processing polls, {counts['context_caches']} context caches"
+        )
+        # ru_maxrss is in kilobytes on Linux.
+        print(
+            f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB (this process), "
+            f"{resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024:.0f} MB (largest child process)"
+        )
+        os.chdir(REPO_ROOT)
+
+if __name__ == "__main__":
+    main()
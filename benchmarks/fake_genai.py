@@ -0,0 +1,252 @@
+"""
+A local stand-in for the parts of `google.generativeai` that the analyzer uses,
+for offline benchmarks. It simulates upload latency, server-side processing,
+generation latency and rate-limit (429) errors, and returns well-formed reports
+with usage metadata, without network access or API quota.
+
+Call install() before anything imports `google.generativeai` (that is, before
+importing analyzer or src.*). It also stubs `yt_dlp` if it is not installed,
+since the benchmarks only use local files.
+"""
+import os
+import sys
+import json
+import time
+import types
+import random
+import itertools
+import datetime
+import threading
+
+# Report returned by every generation request; it satisfies the JSON block
+# expected by the frames, video, window, segment and reduce prompts.
+REPORT_JSON = {
+    "emotional_state": "Calm",
+    "sentiment": {"classification": "Neutral", "justification": "Synthetic benchmark response."},
+    "confidence_level": "Medium",
+    "key_observations": [{"type": "Posture", "detail": "Synthetic observation."}],
+}
+REPORT_MARKDOWN = (
+    "# Behavioral Analysis Report\n\n"
+    "## Summary\n\nThis is a synthetic report produced by the offline benchmark backend.\n\n"
+    "## Observations\n\n" + "".join(f"- Observation {i}: the subject remains steady.\n" for i in range(20)) +
+    "\n```json\n" + json.dumps(REPORT_JSON, indent=2) + "\n```\n"
+)
+
+# Number of characters per streamed chunk.
+STREAM_CHUNK_CHARS = 200
+
+class FakeGeminiConfig:
+    """Latency and error settings of the fake backend, all in seconds unless noted."""
+
+    def __init__(self, upload_sec_per_mb=0.05, upload_base_sec=0.1, processing_sec=2.0,
+                 generation_sec=2.0, generation_jitter=0.25, error_rate=0.0, retry_after_sec=1.0, seed=0):
+        self.upload_sec_per_mb = upload_sec_per_mb
+        self.upload_base_sec = upload_base_sec
+        self.processing_sec = processing_sec
+        self.generation_sec = generation_sec
+        self.generation_jitter = generation_jitter
+        self.error_rate = error_rate
+        self.retry_after_sec = retry_after_sec
+        self.random = random.Random(seed)
+
+class FakeGeminiStats:
+    """Counters of what the fake backend was asked to do."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"uploads": 0, "upload_bytes": 0, "file_polls": 0, "deletes": 0, "requests": 0,
+                       "rate_limited": 0, "images": 0, "context_caches": 0}
+
+    def add(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+def _make_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+def _api_core_exceptions():
+    """Returns google.api_core.exceptions, or minimal stand-ins if google-api-core is not installed."""
+    try:
+        from google.api_core import exceptions
+        return exceptions
+    except ImportError:
+        pass
+
+    class GoogleAPICallError(Exception):
+        code = None
+
+    class TooManyRequests(GoogleAPICallError):
+        code = 429
+
+    exceptions = _make_module("google.api_core.exceptions", GoogleAPICallError=GoogleAPICallError, TooManyRequests=TooManyRequests)
+    for name in ("ResourceExhausted", "InternalServerError", "ServiceUnavailable", "DeadlineExceeded"):
+        setattr(exceptions, name, type(name, (GoogleAPICallError,), {}))
+    api_core = _make_module("google.api_core", exceptions=exceptions)
+    sys.modules["google.api_core"] = api_core
+    sys.modules["google.api_core.exceptions"] = exceptions
+    return exceptions
+
+def _google_package():
+    """Returns the `google` namespace package, creating an empty one if needed."""
+    try:
+        import google
+    except ImportError:
+        google = _make_module("google", __path__=[])
+        sys.modules["google"] = google
+    return google
+
+def install(config=None):
+    """
+    Registers the fake `google.generativeai` (and, if missing, `yt_dlp`) in
+    sys.modules and returns its FakeGeminiStats.
+    """
+    config = config or FakeGeminiConfig()
+    stats = FakeGeminiStats()
+    google = _google_package()
+    exceptions = _api_core_exceptions()
+    files = {}
+    files_lock = threading.Lock()
+    file_numbers = itertools.count(1)
+
+    def sleep_with_jitter(seconds):
+        if seconds > 0:
+            jitter = config.generation_jitter
+            with files_lock:
+                factor = config.random.uniform(1 - jitter, 1 + jitter)
+            time.sleep(seconds * factor)
+
+    class State:
+        def __init__(self, name):
+            self.name = name
+
+    class File:
+        def __init__(self, name, display_name, ready_at):
+            self.name = name
+            self.display_name = display_name
+            self.ready_at = ready_at
+            self.expiration_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=48)
+
+        @property
+        def state(self):
+            return State("ACTIVE" if time.monotonic() >= self.ready_at else "PROCESSING")
+
+    def configure(api_key=None, **kwargs):
+        pass
+
+    def upload_file(path, **kwargs):
+        size = os.path.getsize(path)
+        time.sleep(config.upload_base_sec + config.upload_sec_per_mb * size / 1e6)
+        stats.add("uploads")
+        stats.add("upload_bytes", size)
+        with files_lock:
+            # Unique across deletes and processes, like real file names.
+            name = f"files/fake-{os.getpid()}-{next(file_numbers)}"
+            files[name] = File(name, os.path.basename(path), time.monotonic() + config.processing_sec)
+            return files[name]
+
+    def get_file(name):
+        stats.add("file_polls")
+        with files_lock:
+            return files[name]
+
+    def delete_file(name):
+        stats.add("deletes")
+        with files_lock:
+            files.pop(name, None)
+
+    class UsageMetadata:
+        def __init__(self, prompt_tokens, output_tokens, cached_tokens=0):
+            self.prompt_token_count = prompt_tokens
+            self.candidates_token_count = output_tokens
+            self.cached_content_token_count = cached_tokens
+            self.total_token_count = prompt_tokens + output_tokens
+
+    class Response:
+        def __init__(self, text, usage_metadata):
+            self.usage_metadata = usage_metadata
+            parts = [types.SimpleNamespace(text=text)] if text else []
+            self.candidates = [types.SimpleNamespace(content=types.SimpleNamespace(parts=parts))]
+
+        @property
+        def text(self):
+            parts = self.candidates[0].content.parts
+            if not parts:
+                # Like the SDK, whose quick accessor fails on chunks without parts.
+                raise ValueError("Invalid operation: The `response.text` quick accessor requires the response to contain a valid `Part`.")
+            return parts[0].text
+
+    class StreamedResponse:
+        def __init__(self, usage_metadata, first_chunk_delay):
+            self.usage_metadata = usage_metadata
+            self.first_chunk_delay = first_chunk_delay
+
+        def __iter__(self):
+            sleep_with_jitter(self.first_chunk_delay)
+            chunks = range(0, len(REPORT_MARKDOWN), STREAM_CHUNK_CHARS)
+            for start in chunks:
+                time.sleep(config.generation_sec / 2 / len(chunks))
+                yield Response(REPORT_MARKDOWN[start:start + STREAM_CHUNK_CHARS], None)
+            # Final chunk with only the finish reason and no text parts, like the API's.
+            yield Response("", self.usage_metadata)
+
+    class GenerativeModel:
+        def __init__(self, model_name=None, cached_tokens=0, **kwargs):
+            self.model_name = model_name
+            self.cached_tokens = cached_tokens
+
+        @classmethod
+        def from_cached_content(cls, cached_content):
+            return cls(cached_content.model, cached_tokens=cached_content.tokens)
+
+        def generate_content(self, contents, stream=False, **kwargs):
+            stats.add("requests")
+            with files_lock:
+                rate_limited = config.random.random() < config.error_rate
+            if rate_limited:
+                stats.add("rate_limited")
+                raise exceptions.TooManyRequests(f"Resource has been exhausted. Please retry in {config.retry_after_sec}s.")
+            parts = contents if isinstance(contents, list) else [contents]
+            images = sum(1 for part in parts if isinstance(part, dict))
+            videos = sum(1 for part in parts if isinstance(part, File))
+            stats.add("images", images)
+            prompt_tokens = sum(len(part) // 4 for part in parts if isinstance(part, str)) + 258 * images + 10000 * videos
+            usage = UsageMetadata(prompt_tokens + self.cached_tokens, len(REPORT_MARKDOWN) // 4, self.cached_tokens)
+            if stream:
+                return StreamedResponse(usage, config.generation_sec / 2)
+            sleep_with_jitter(config.generation_sec)
+            return Response(REPORT_MARKDOWN, usage)
+
+    class CachedContent:
+        def __init__(self, name, model, tokens):
+            self.name = name
+            self.model = model
+            self.tokens = tokens
+
+        @classmethod
+        def create(cls, model, contents, ttl=None, **kwargs):
+            stats.add("context_caches")
+            images = sum(1 for part in contents if isinstance(part, dict))
+            videos = sum(1 for part in contents if isinstance(part, File))
+            return cls(f"cachedContents/fake-{stats.counts['context_caches']}", model, 258 * images + 10000 * videos)
+
+        def delete(self):
+            pass
+
+    caching = _make_module("google.generativeai.caching", CachedContent=CachedContent)
+    genai = _make_module(
+        "google.generativeai",
+        configure=configure, upload_file=upload_file, get_file=get_file, delete_file=delete_file,
+        GenerativeModel=GenerativeModel, caching=caching,
+    )
+    sys.modules["google.generativeai"] = genai
+    sys.modules["google.generativeai.caching"] = caching
+    google.generativeai = genai
+
+    try:
+        import yt_dlp  # noqa: F401
+    except ImportError:
+        sys.modules["yt_dlp"] = _make_module("yt_dlp", YoutubeDL=None)
+    return stats
@@ -0,0 +1,216 @@
+"""
+Smoke test of the --serve HTTP API, offline. It first checks that manifest
+items with invalid options are rejected, then starts the service on an
+ephemeral port with create_server() and drives it over HTTP: first with an
+injected `process` that returns immediately, to check the API itself (job
+submission, status, results, health and malformed requests), then with the
+real per-input pipeline on a synthetic video against the local Gemini
+stand-in in benchmarks/fake_genai.py. Exits with status 1 if a check fails.
+
+    python -m benchmarks.smoke_service
+    python -m benchmarks.smoke_service --verbose
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import http.client
+
+os.environ.setdefault("TQDM_DISABLE", "1")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import fake_genai
+from benchmarks.synthetic import make_synthetic_video
+
+class Checks:
+    """Prints and counts check results."""
+
+    def __init__(self):
+        self.failed = 0
+
+    def check(self, condition, description):
+        print(f"{'ok  ' if condition else 'FAIL'} {description}")
+        if not condition:
+            self.failed += 1
+        return condition
+
+def request(port, method, path, body=None, headers=None):
+    """Sends one request and returns (status, parsed JSON body)."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        connection.request(method, path, body=data, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"null")
+    finally:
+        connection.close()
+
+def raw_post(port, headers, body=b""):
+    """Sends a POST /jobs with exactly the given headers and body and returns the response status, or None on timeout."""
+    with socket.create_connection(("127.0.0.1", port), timeout=10) as sock:
+        lines = ["POST /jobs HTTP/1.1", "Host: 127.0.0.1"] + [f"{name}: {value}" for name, value in headers]
+        sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("ascii") + body)
+        try:
+            status_line = sock.makefile("rb").readline()
+        except socket.timeout:
+            return None
+        return int(status_line.split()[1]) if status_line else None
+
+def wait_for_job(port, job_id, timeout_sec):
+    """Polls a job until it leaves 'queued' and 'running' and returns its status, or the last status seen on timeout."""
+    deadline = time.monotonic() + timeout_sec
+    while True:
+        _, status = request(port, "GET", f"/jobs/{job_id}")
+        if status["status"] not in ("queued", "running") or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+def start_service(args, process=None):
+    """Starts an AnalysisService and its HTTP server on an ephemeral port; returns (service, server, port)."""
+    from src.service import AnalysisService, create_server
+    service = AnalysisService(args, process)
+    server = create_server(service, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, name="smoke-server", daemon=True).start()
+    return service, server, server.server_port
+
+def stop_service(service, server):
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+def check_manifest_validation(checks, tmp):
+    """Checks that manifest items are validated like the command-line flags they override."""
+    from src.jobs import load_manifest, parse_manifest_item
+
+    def rejected(raw):
+        try:
+            parse_manifest_item(raw, "item 0")
+        except ValueError:
+            return True
+        return False
+
+    for key, value in (("model", "../../etc"), ("analysis_mode", "audio"), ("sampler", "bogus"), ("frame_backend", "gstreamer"),
+                       ("interval", 0), ("interval", -5), ("interval", "abc"), ("start", 5), ("end", 0)):
+        raw = {"input": "a.mp4", key: value}
+        if key == "start":
+            raw["end"] = 2
+        checks.check(rejected(raw), f"a manifest item with {key}={value!r} is rejected")
+    checks.check(rejected({"input": "a.mp4", "unknown": 1}), "a manifest item with an unknown option is rejected")
+    checks.check(not rejected({"input": "a.mp4", "model": "gemini-2.5-flash", "analysis_mode": "frames", "sampler": "seek",
+                               "frame_backend": "ffmpeg", "interval": "5"}), "a manifest item with valid options is accepted")
+
+    manifest_path = os.path.join(tmp, "manifest.csv")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        f.write("input,model,interval\na.mp4,gemini-2.5-pro,2\nb.mp4,../outside,1\n")
+    try:
+        load_manifest(manifest_path)
+        checks.check(False, "a CSV manifest with an invalid model is rejected")
+    except ValueError as e:
+        checks.check(":3:" in str(e), "a CSV manifest with an invalid model is rejected, naming the row")
+
+def check_api(checks, args, video_path):
+    """Exercises the API with an injected process that writes no reports."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def process(video_input, overrides, args, context):
+        if overrides.get("focus") == ["hold"]:
+            started.set()
+            release.wait(30)
+        if video_input.endswith("missing.mp4"):
+            return {"status": "failed", "stage": "hash", "error": "File not found", "output_dirs": []}
+        return {"status": "done", "stage": None, "error": None, "output_dirs": []}
+
+    service, server, port = start_service(args, process)
+    try:
+        status, body = request(port, "GET", "/health")
+        checks.check(status == 200 and body["workers"] == args.jobs, "GET /health reports the workers")
+
+        status, body = request(port, "POST", "/jobs", {"input": video_path, "focus": "hold"})
+        checks.check(status == 202 and len(body["jobs"]) == 1, "POST /jobs accepts a job object")
+        held = body["jobs"][0]["id"]
+        started.wait(10)
+        status, body = request(port, "GET", f"/jobs/{held}/result")
+        checks.check(status == 409 and body["job"]["status"] == "running", "GET /jobs/<id>/result is 409 while the job runs")
+        release.set()
+        checks.check(wait_for_job(port, held, 10)["status"] == "done", "the job finishes")
+
+        status, body = request(port, "POST", "/jobs", [video_path, {"input": os.path.join(os.path.dirname(video_path), "missing.mp4")}])
+        checks.check(status == 202 and len(body["jobs"]) == 2, "POST /jobs accepts a list of jobs")
+        done, failed = (wait_for_job(port, job["id"], 10) for job in body["jobs"])
+        checks.check(done["status"] == "done", "a string item is queued as an input")
+        checks.check(failed["status"] == "failed" and failed["stage"] == "hash", "a failed job reports its stage")
+        status, body = request(port, "GET", f"/jobs/{done['id']}/result")
+        checks.check(status == 200 and body["reports"] == [], "GET /jobs/<id>/result returns the finished job")
+
+        status, body = request(port, "GET", "/jobs")
+        checks.check(status == 200 and len(body["jobs"]) == 3, "GET /jobs lists all jobs")
+        checks.check(request(port, "GET", "/jobs/unknown")[0] == 404, "an unknown job is 404")
+        checks.check(request(port, "GET", "/nothing")[0] == 404, "an unknown path is 404")
+
+        checks.check(request(port, "POST", "/jobs", {"focus": "x"})[0] == 400, "an item without 'input' is 400")
+        checks.check(request(port, "POST", "/jobs", {"input": video_path, "start": 5, "end": 2})[0] == 400, "an item whose end is before its start is 400")
+        checks.check(request(port, "POST", "/jobs", [])[0] == 400, "an empty list is 400")
+        for key, value in (("model", "../../etc"), ("sampler", "bogus"), ("frame_backend", "gstreamer"), ("interval", 0)):
+            checks.check(request(port, "POST", "/jobs", {"input": video_path, key: value})[0] == 400, f"an item with {key}={value!r} is 400")
+        checks.check(request(port, "POST", "/jobs", [video_path, {"input": video_path, "model": "nope"}])[0] == 400, "a list with one invalid item is 400")
+        checks.check(raw_post(port, [("Content-Length", "5")], b"{nope") == 400, "invalid JSON is 400")
+        checks.check(raw_post(port, [("Content-Type", "application/json")]) == 411, "a missing Content-Length is 411")
+        checks.check(raw_post(port, [("Content-Length", "abc")]) == 400, "a non-numeric Content-Length is 400")
+        checks.check(raw_post(port, [("Content-Length", "-1")]) == 400, "a negative Content-Length is 400")
+        checks.check(raw_post(port, [("Content-Length", str(64 * 1024 * 1024))]) == 413, "an oversized Content-Length is 413")
+        checks.check(request(port, "GET", "/health")[0] == 200, "the service still answers after malformed requests")
+        checks.check(request(port, "GET", "/health")[1]["jobs"] == {"done": 2, "failed": 1}, "malformed requests queued no jobs")
+    finally:
+        release.set()
+        stop_service(service, server)
+
+def check_pipeline(checks, args, video_path, timeout_sec):
+    """Runs one job through the real pipeline against the fake Gemini backend."""
+    service, server, port = start_service(args)
+    try:
+        status, body = request(port, "POST", "/jobs", {"input": video_path, "language": "Spanish"})
+        checks.check(status == 202, "POST /jobs queues a pipeline job")
+        job = wait_for_job(port, body["jobs"][0]["id"], timeout_sec)
+        checks.check(job["status"] == "done", f"the pipeline job completes (status: {job['status']}, error: {job['error']})")
+        status, body = request(port, "GET", f"/jobs/{job['id']}/result")
+        reports = body["reports"] if status == 200 else []
+        checks.check(len(reports) == 1 and reports[0]["markdown"], "the result includes the report's analysis.md")
+        checks.check(len(reports) == 1 and isinstance(reports[0]["analysis"], dict), "the result includes the report's analysis.json")
+    finally:
+        stop_service(service, server)
+
+def main():
+    parser = argparse.ArgumentParser(description="Smoke-test the --serve HTTP API offline against a simulated Gemini backend.")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for the pipeline job.")
+    parser.add_argument("--verbose", action="store_true", help="Show the analyzer's log output.")
+    args = parser.parse_args()
+
+    fake_genai.install(fake_genai.FakeGeminiConfig(upload_base_sec=0, processing_sec=0.1, generation_sec=0.1))
+    os.environ.setdefault("GEMINI_API_KEY", "offline-smoke-test")
+    import analyzer
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    checks = Checks()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        check_manifest_validation(checks, tmp)
+        video_path = make_synthetic_video(os.path.join(tmp, "videos", "synthetic.mp4"), duration_sec=3, fps=10)
+        service_args = analyzer.build_parser().parse_args(["--serve", "--jobs", "2", "--analysis-mode", "frames", "--no-cache"])
+        check_api(checks, service_args, video_path)
+        check_pipeline(checks, service_args, video_path, args.timeout)
+        os.chdir(REPO_ROOT)
+
+    print()
+    print(f"{checks.failed} checks failed" if checks.failed else "All checks passed")
+    sys.exit(1 if checks.failed else 0)
+
+if __name__ == "__main__":
+    main()
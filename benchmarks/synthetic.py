@@ -0,0 +1,30 @@
+import os
+import cv2
+import numpy as np
+
+def make_synthetic_video(path, duration_sec=10, fps=30, width=640, height=360, scene_length_sec=None, seed=0):
+    """
+    Writes a synthetic test video with cv2.VideoWriter and returns its path.
+
+    Each frame is a moving gradient with a frame counter so that consecutive frames
+    differ. If `scene_length_sec` is set, the background colour changes every
+    `scene_length_sec` seconds to simulate scene cuts. Videos with different
+    `seed` values have different content (and therefore different hashes).
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open a video writer for {path}")
+
+    gradient = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    total_frames = int(duration_sec * fps)
+    for frame_index in range(total_frames):
+        shift = (frame_index * 4 + seed * 37) % width
+        frame = np.dstack([np.roll(gradient, shift, axis=1)] * 3)
+        if scene_length_sec:
+            scene = int(frame_index / (fps * scene_length_sec))
+            frame[:, :, scene % 3] = 255 - frame[:, :, scene % 3]
+        cv2.putText(frame, f"{seed}:{frame_index}" if seed else str(frame_index), (20, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 255), 3)
+        writer.write(frame)
+    writer.release()
+    return path
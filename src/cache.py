@@ -0,0 +1,286 @@
+import os
+import json
+import shutil
+import hashlib
+import secrets
+import logging
+import tempfile
+import threading
+
+def make_cache_key(video_hash, parameters):
+    """
+    Derives a cache key from a video's SHA256 hash and a JSON-serializable dict of
+    everything else that determines the analysis result (model, prompt, options).
+    """
+    fingerprint = json.dumps(parameters, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{video_hash}\n{fingerprint}".encode("utf-8")).hexdigest()
+
+def atomic_write(path, data):
+    """Writes bytes to `path` through a temporary file in the same directory, so readers never see a partial file."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # Unlike mkstemp, which creates the file as 0600, this lets the kernel apply
+    # the umask to 0666 as open() would, so that e.g. node_exporter and
+    # status.json pollers can read the result. O_EXCL keeps the name private.
+    while True:
+        tmp_path = os.path.join(directory, f".tmp-{secrets.token_hex(8)}")
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def evict_lru(entries, max_bytes):
+    """
+    Removes the least recently used entries until their total size is at most
+    `max_bytes`. `entries` is a list of (last_used, size, path) tuples, where
+    path is a file or a directory. Returns the number of entries evicted.
+    """
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            total -= size
+            evicted += 1
+        except FileNotFoundError:
+            pass
+    return evicted
+
+class ResultCache:
+    """
+    On-disk cache of analysis results, one JSON file per key.
+
+    Entries are sharded by the first two characters of their key. Recency is
+    tracked with the file modification time, which is refreshed on every hit;
+    when the cache grows beyond `max_bytes`, the least recently used entries
+    are evicted.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached entry for `key` and marks it as recently used, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            entry = None
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Ignoring unreadable cache entry {path}: {e}")
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """Stores a JSON-serializable entry under `key`, then evicts old entries if over the size limit."""
+        try:
+            data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+            atomic_write(self._path(key), data)
+        except (OSError, TypeError) as e:
+            logging.error(f"Failed to write cache entry {key}: {e}")
+            return
+        with self._lock:
+            self.writes += 1
+            self._evict()
+
+    def _entries(self):
+        """Lists (mtime, size, path) for every entry in the cache."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        if self.max_bytes:
+            self.evictions += evict_lru(self._entries(), self.max_bytes)
+
+    def stats(self):
+        """Returns a dict of hit/miss/write/eviction counts and the current size of the cache."""
+        entries = self._entries()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+            }
+
+class MediaCache:
+    """
+    Persistent cache of acquired videos, keyed by a stable source ID such as a
+    YouTube video ID.
+
+    Each entry is a directory holding the converted MP4 and a meta.json with
+    its original filename and SHA256 hash. Files are moved in with atomic
+    renames, so concurrent runs never see a partial entry. Recency is tracked
+    with meta.json's modification time, and least recently used entries are
+    evicted once the cache grows beyond `max_bytes`.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """Returns (video_path, meta) for a cached entry and marks it as recently used, or None."""
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            video_path = os.path.join(entry_dir, meta["file"])
+            if not os.path.exists(video_path):
+                return None
+            os.utime(meta_path)
+            return video_path, meta
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, json.JSONDecodeError) as e:
+            logging.warning(f"Ignoring unreadable media cache entry {entry_dir}: {e}")
+            return None
+
+    def put(self, key, video_path, original_filename, video_hash):
+        """
+        Moves a video into the cache and records its metadata. Returns the cached
+        path, or the original path if the video could not be cached.
+        """
+        entry_dir = self._entry_dir(key)
+        file_name = "video" + os.path.splitext(video_path)[1]
+        cached_path = os.path.join(entry_dir, file_name)
+        meta = {"file": file_name, "original_filename": original_filename, "sha256": video_hash}
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix=".tmp-")
+            os.close(fd)
+            shutil.move(video_path, tmp_path)
+            os.replace(tmp_path, cached_path)
+            atomic_write(os.path.join(entry_dir, "meta.json"), json.dumps(meta, indent=4).encode("utf-8"))
+        except OSError as e:
+            logging.error(f"Failed to add {video_path} to the media cache: {e}")
+            return video_path if os.path.exists(video_path) else None
+
+        with self._lock:
+            self._evict(keep=entry_dir)
+        return cached_path
+
+    def _evict(self, keep):
+        if not self.max_bytes:
+            return
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(key)
+            if entry_dir == keep or not os.path.isdir(entry_dir):
+                continue
+            try:
+                last_used = os.stat(os.path.join(entry_dir, "meta.json")).st_mtime
+            except FileNotFoundError:
+                last_used = 0
+            size = sum(
+                os.path.getsize(os.path.join(root, name))
+                for root, _, files in os.walk(entry_dir) for name in files
+            )
+            entries.append((last_used, size, entry_dir))
+        budget = self.max_bytes - sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(keep) for name in files
+        )
+        evicted = evict_lru(entries, max(0, budget))
+        if evicted:
+            logging.info(f"Evicted {evicted} least recently used videos from the media cache.")
+
+class HashCache:
+    """
+    Persistent record of file hashes, so unchanged files are not read again.
+
+    Hashes are stored in a single JSON file keyed by absolute path, and an
+    entry is only valid while the file's size, modification time and inode
+    all still match. Entries of deleted files are pruned on every write.
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Ignoring unreadable hash cache {self.cache_path}: {e}")
+            return {}
+
+    @staticmethod
+    def _identity(path):
+        stat = os.stat(path)
+        return os.path.abspath(path), {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "inode": stat.st_ino}
+
+    def get(self, path):
+        """Returns the recorded hash for `path` if the file is unchanged, else None."""
+        key, identity = self._identity(path)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and all(entry.get(k) == v for k, v in identity.items()):
+            return entry["sha256"]
+        return None
+
+    def put(self, path, sha256):
+        """Records the hash of `path` together with its current size, mtime and inode."""
+        key, identity = self._identity(path)
+        with self._lock:
+            # Merge with entries written by concurrent runs since we loaded the file
+            # (theirs are newer than our in-memory copies), dropping entries for
+            # files that no longer exist.
+            merged = {**self._entries, **self._load()}
+            self._entries = {path: entry for path, entry in merged.items() if os.path.exists(path)}
+            self._entries[key] = {**identity, "sha256": sha256}
+            try:
+                atomic_write(self.cache_path, json.dumps(self._entries, indent=1).encode("utf-8"))
+            except OSError as e:
+                logging.warning(f"Failed to update hash cache {self.cache_path}: {e}")
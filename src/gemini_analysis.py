@@ -1,15 +1,37 @@
 import os
 import google.generativeai as genai
-from dotenv import load_dotenv
 import logging
 import re
 import json
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from tqdm import tqdm
 
+from src.cache import atomic_write
+from src import metrics
+from src.gemini_client import (
+    configure_gemini, generate_content, generate_content_stream, upload_file, get_file, delete_file, create_cached_content
+)
+
+# Models and analysis modes offered by --model and --analysis-mode (and accepted in manifests).
+GEMINI_MODELS = ['gemini-1.5-flash', 'gemini-1.5-pro', 'gemini-2.5-flash', 'gemini-2.5-pro']
+ANALYSIS_MODES = ['frames', 'video']
+
+# Registered uploads this close to their server-side expiry are uploaded again.
+UPLOAD_EXPIRY_MARGIN = datetime.timedelta(hours=1)
+
+# Lifetime of context caches shared by prompt variants; they are deleted as soon as all variants finish.
+CONTEXT_CACHE_TTL = datetime.timedelta(minutes=30)
+
+# The fenced JSON block at the end of every report.
+JSON_BLOCK_PATTERN = re.compile(r"```json\n(.*?)\n```", re.DOTALL)
+
 def parse_json_from_markdown(markdown_text):
     """Extracts and parses a JSON object from a Markdown code block."""
     try:
-        match = re.search(r"```json\n(.*?)\n```", markdown_text, re.DOTALL)
+        match = JSON_BLOCK_PATTERN.search(markdown_text)
         if match:
             json_string = match.group(1)
             return json.loads(json_string)
@@ -22,28 +44,8 @@ def parse_json_from_markdown(markdown_text):
         logging.error(f"An unexpected error occurred during JSON parsing: {e}")
     return None
 
-def analyze_frames_with_gemini(frames, model_name, focus, language):
-    """
-    Analyzes frames using a Gemini model and returns the full markdown
-    and a parsed JSON object.
-    """
-    # (The existing frame analysis code remains unchanged)
-    if not frames:
-        logging.warning("No frames were provided for analysis.")
-        return None, None
-
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        logging.critical("GEMINI_API_KEY not found. Please set it in a .env file.")
-        return None, None
-    genai.configure(api_key=api_key)
-
-    model = genai.GenerativeModel(f'models/{model_name}')
-    logging.info(f"Analyzing frames with {model_name}...")
-
-    image_parts = [{"mime_type": "image/jpeg", "data": frame} for frame in frames]
-
+def build_frames_prompt(focus, language):
+    """Builds the analysis prompt for a sequence of still frames."""
     prompt_parts = [
         "You are an expert in behavioral analysis and non-verbal communication.",
         "Analyze the provided sequence of images, which are frames from a video."
@@ -95,61 +97,465 @@ Finally, after the summary, provide a JSON object containing the key findings. T
 ```
 """)
     
-    prompt = "\n".join(prompt_parts)
+    return "\n".join(prompt_parts)
+
+def build_video_prompt(focus, language):
+    """Builds the analysis prompt for a video file, including its audio track."""
+    prompt_parts = [
+        "You are an expert in behavioral analysis, skilled in interpreting both visual and auditory cues.",
+        "Analyze the provided video file, paying attention to both the visual elements and the audio track."
+    ]
+    if focus:
+        prompt_parts.append(f"Your analysis should focus on: {focus}.")
+    else:
+        prompt_parts.append("Focus on the primary individual visible and audible in the video.")
+
+    prompt_parts.append("Based on their facial expressions, body language, gestures, tone of voice, and speech patterns, please provide a comprehensive report in Markdown format.")
+    
+    if language:
+        prompt_parts.append(f"The report must be written in {language}.")
+
+    prompt_parts.append("""
+The report should include the following sections:
+
+## Overall Emotional State
+- A summary of the person's dominant emotional state, considering both visual and auditory cues.
+
+## Sentiment Analysis
+- Classify the overall sentiment as Positive, Negative, or Neutral, justifying your answer with evidence from both video and audio.
+
+## Detailed Observations
+- **Visual Cues:** Describe specific facial expressions, posture, and body movements (e.g., fidgeting, leaning forward, breaking eye contact).
+- **Auditory Cues:** Describe the tone of voice (e.g., wavering, confident, monotone), pace of speech, use of filler words, and any notable pauses or hesitations.
+- **Potential Inferred Feelings:** Infer potential feelings (e.g., nervousness, confidence, deception, honesty) and support your inferences with specific, timestamped examples from the video if possible.
+
+## Confidence Level
+- Assess the person's apparent confidence level on a scale of Low, Medium, or High, explaining your reasoning based on both visual and auditory evidence.
+
+## Summary
+- Conclude with a brief, holistic summary of your findings.
+
+Finally, after the summary, provide a JSON object containing the key findings. The JSON object should be enclosed in a Markdown code block like this:
+```json
+{
+  "emotional_state": "...",
+  "sentiment": {
+    "classification": "...",
+    "justification": "..."
+  },
+  "confidence_level": "...",
+  "key_observations": [
+    {"type": "visual_cue", "detail": "..."},
+    {"type": "auditory_cue", "detail": "..."}
+  ]
+}
+```
+""")
+    
+    return "\n".join(prompt_parts)
 
+def stream_report(model_name, contents, stream_writer):
+    """
+    Sends a request with a streamed response, passing each chunk to a
+    StreamingReportWriter as it arrives. The JSON block is parsed and saved
+    as soon as its closing fence has been received. Returns the full markdown
+    and the parsed JSON object; errors are recorded on the writer and re-raised.
+    """
+    stream_writer.start()
+    full_markdown = ""
+    json_data = None
     try:
-        response = model.generate_content([prompt] + image_parts)
-        full_markdown = response.text
+        for text in generate_content_stream(model_name, contents):
+            stream_writer.write(text)
+            full_markdown += text
+            if json_data is None and JSON_BLOCK_PATTERN.search(full_markdown):
+                json_data = parse_json_from_markdown(full_markdown)
+                if json_data is not None:
+                    stream_writer.write_json(json_data)
+    except Exception as e:
+        stream_writer.fail(str(e))
+        raise
+    if json_data is None:
         json_data = parse_json_from_markdown(full_markdown)
+    return full_markdown, json_data
+
+def analyze_frames_with_gemini(frames, model_name, focus, language, stream_writer=None):
+    """
+    Analyzes frames using a Gemini model and returns the full markdown
+    and a parsed JSON object.
+
+    `frames` may be any iterable of JPEG bytes or (timestamp_sec, jpeg_bytes)
+    tuples, such as the generator returned by iter_frames. It is consumed in a
+    single pass so that each frame is only held once, inside the request.
+
+    With a StreamingReportWriter, the response is streamed into the report as
+    it is generated (see stream_report).
+    """
+    image_parts = [
+        {"mime_type": "image/jpeg", "data": frame[1] if isinstance(frame, tuple) else frame}
+        for frame in (frames or [])
+    ]
+    if not image_parts:
+        logging.warning("No frames were provided for analysis.")
+        return None, None
+
+    if not configure_gemini():
+        return None, None
+
+    logging.info(f"Analyzing {len(image_parts)} frames with {model_name}...")
+
+    prompt = build_frames_prompt(focus, language)
+
+    try:
+        if stream_writer:
+            full_markdown, json_data = stream_report(model_name, [prompt] + image_parts, stream_writer)
+        else:
+            response = generate_content(model_name, [prompt] + image_parts)
+            full_markdown = response.text
+            json_data = parse_json_from_markdown(full_markdown)
         logging.info("Successfully received and parsed response from Gemini.")
         return full_markdown, json_data
     except Exception as e:
         logging.error(f"An error occurred during the Gemini API call: {e}")
         return None, None
 
-def analyze_video_with_gemini(video_path, model_name, focus, language):
+def wait_for_file_active(video_file, timeout=600, initial_delay=1.0, max_delay=15.0):
     """
-    Analyzes a video file directly using a Gemini model, including audio.
-    Returns the full markdown and a parsed JSON object.
+    Polls an uploaded file until the server has finished processing it, with
+    exponential backoff between polls. Returns the ACTIVE file, or None if
+    processing failed or did not finish within `timeout` seconds.
     """
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        logging.critical("GEMINI_API_KEY not found. Please set it in a .env file.")
-        return None, None
-    genai.configure(api_key=api_key)
-
-    model = genai.GenerativeModel(f'models/{model_name}')
-    logging.info(f"Uploading video file: {video_path}...")
-    
-    # Upload the video file
-    video_file = genai.upload_file(path=video_path)
-    logging.info(f"Successfully uploaded {video_file.display_name}.")
-
-    # Wait for the file to be processed
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
     while video_file.state.name == "PROCESSING":
+        if time.monotonic() + delay > deadline:
+            logging.error(f"Timed out after {timeout}s waiting for {video_file.name} to be processed.")
+            return None
         print('.', end='', flush=True)
-        video_file = genai.get_file(video_file.name)
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+        video_file = get_file(video_file.name)
     print() # Newline after processing dots
 
-    if video_file.state.name == "FAILED":
+    if video_file.state.name != "ACTIVE":
+        logging.error(f"Processing of {video_file.name} ended in state {video_file.state.name}.")
+        return None
+    return video_file
+
+def upload_video_file(video_path, timeout=600):
+    """Uploads a video and waits for it to become ACTIVE. Returns the file, or None on failure."""
+    logging.info(f"Uploading video file: {video_path}...")
+    try:
+        with metrics.span("upload", bytes=os.path.getsize(video_path)):
+            video_file = upload_file(video_path)
+        logging.info(f"Successfully uploaded {video_file.display_name}.")
+        with metrics.span("processing_wait"):
+            return wait_for_file_active(video_file, timeout)
+    except Exception as e:
+        logging.error(f"Failed to upload {video_path}: {e}")
+        return None
+
+def delete_video_file(video_file_name):
+    """Deletes an uploaded file, logging rather than raising on failure."""
+    try:
+        delete_file(video_file_name)
+        logging.info(f"Cleaned up uploaded file: {video_file_name}")
+    except Exception as e:
+        logging.warning(f"Failed to delete uploaded file {video_file_name}: {e}")
+
+class UploadRegistry:
+    """
+    Shares uploaded Gemini files between the consumers of the same video.
+
+    Consumers call acquire() to get an ACTIVE file and release() when done.
+    By default a file is deleted as soon as its last consumer in this run has
+    released it. With `keep_uploads`, files are instead recorded in a
+    persistent map from video SHA256 to file name and left on the server
+    until they expire, so later runs can reuse them instead of uploading the
+    same video again.
+    """
+
+    def __init__(self, registry_path, keep_uploads=False, upload_timeout=600):
+        self.registry_path = registry_path
+        self.keep_uploads = keep_uploads
+        self.upload_timeout = upload_timeout
+        self._lock = threading.Lock()
+        self._hash_locks = {}
+        self._refcounts = {}
+        self._files = {}
+
+    def _load(self):
+        try:
+            with open(self.registry_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Ignoring unreadable upload registry {self.registry_path}: {e}")
+            return {}
+
+    def _register(self, video_hash, entry):
+        """Records one upload, merging with entries written by concurrent runs since the file was last read."""
+        with self._lock:
+            entries = self._load()
+            entries[video_hash] = entry
+            try:
+                atomic_write(self.registry_path, json.dumps(entries, indent=4).encode("utf-8"))
+            except OSError as e:
+                logging.warning(f"Failed to update upload registry {self.registry_path}: {e}")
+
+    def _lookup(self, video_hash):
+        """Returns the registered remote file for a hash if it is still usable, else None."""
+        with self._lock:
+            entry = self._load().get(video_hash)
+        if not entry:
+            return None
+        expires = entry.get("expiration_time")
+        if expires:
+            expires = datetime.datetime.fromisoformat(expires)
+            if expires.tzinfo is None:
+                expires = expires.replace(tzinfo=datetime.timezone.utc)
+            if expires - UPLOAD_EXPIRY_MARGIN < datetime.datetime.now(datetime.timezone.utc):
+                return None
+        try:
+            return wait_for_file_active(get_file(entry["name"]), self.upload_timeout)
+        except Exception as e:
+            logging.info(f"Registered upload {entry['name']} is no longer usable: {e}")
+            return None
+
+    def acquire(self, video_path, video_hash):
+        """Returns an ACTIVE remote file for the video, uploading it only if no usable copy exists."""
+        with self._lock:
+            hash_lock = self._hash_locks.setdefault(video_hash, threading.Lock())
+            self._refcounts[video_hash] = self._refcounts.get(video_hash, 0) + 1
+
+        with hash_lock:
+            try:
+                with self._lock:
+                    video_file = self._files.get(video_hash)
+                if not video_file and self.keep_uploads:
+                    video_file = self._lookup(video_hash)
+                    if video_file:
+                        logging.info(f"Reusing uploaded file {video_file.name} for {os.path.basename(video_path)}.")
+                if not video_file:
+                    video_file = upload_video_file(video_path, self.upload_timeout)
+                    if video_file and self.keep_uploads:
+                        expiration = getattr(video_file, "expiration_time", None)
+                        self._register(video_hash, {
+                            "name": video_file.name,
+                            "expiration_time": expiration.isoformat() if expiration else None,
+                        })
+            except Exception as e:
+                logging.error(f"Failed to get an uploaded file for {os.path.basename(video_path)}: {e}")
+                video_file = None
+            with self._lock:
+                if video_file:
+                    self._files[video_hash] = video_file
+                else:
+                    self._refcounts[video_hash] -= 1
+        return video_file
+
+    def release(self, video_hash):
+        """
+        Marks one consumer of the video's remote file as done. The file is
+        deleted when this was its last consumer, unless `keep_uploads` is set.
+        """
+        with self._lock:
+            self._refcounts[video_hash] = max(0, self._refcounts.get(video_hash, 0) - 1)
+            video_file = self._files.pop(video_hash, None) if not self._refcounts[video_hash] else None
+        if video_file and not self.keep_uploads:
+            delete_video_file(video_file.name)
+
+    def close(self):
+        """Deletes any file of this run that was not released, unless `keep_uploads` is set."""
+        with self._lock:
+            remaining, self._files = list(self._files.values()), {}
+        if not self.keep_uploads:
+            for video_file in remaining:
+                delete_video_file(video_file.name)
+
+def analyze_video_with_gemini(video_path, model_name, focus, language, video_hash=None, registry=None, stream_writer=None):
+    """
+    Analyzes a video file directly using a Gemini model, including audio.
+    Returns the full markdown and a parsed JSON object.
+
+    If an UploadRegistry and the video's hash are given, a previously uploaded
+    copy is reused and the file's lifetime is left to the registry; otherwise
+    the video is uploaded and deleted after the analysis. With a
+    StreamingReportWriter, the response is streamed into the report.
+    """
+    if not configure_gemini():
+        return None, None
+
+    if registry and video_hash:
+        video_file = registry.acquire(video_path, video_hash)
+    else:
+        video_file = upload_video_file(video_path)
+    if not video_file:
         logging.error(f"Video processing failed for {video_path}.")
         return None, None
 
     logging.info(f"Analyzing video and audio with {model_name}...")
 
-    # Dynamically build the prompt for video and audio analysis
+    prompt = build_video_prompt(focus, language)
+
+    try:
+        if stream_writer:
+            full_markdown, json_data = stream_report(model_name, [prompt, video_file], stream_writer)
+        else:
+            response = generate_content(model_name, [prompt, video_file])
+            full_markdown = response.text
+            json_data = parse_json_from_markdown(full_markdown)
+        logging.info("Successfully received and parsed response from Gemini.")
+        return full_markdown, json_data
+    except Exception as e:
+        logging.error(f"An error occurred during the Gemini API call: {e}")
+        return None, None
+    finally:
+        if registry and video_hash:
+            registry.release(video_hash)
+        else:
+            delete_video_file(video_file.name)
+
+def create_context_cache(model_name, contents, ttl=CONTEXT_CACHE_TTL):
+    """
+    Stores shared request contents (an uploaded video, or frames) in a Gemini
+    context cache so that several prompts can reuse them without resending or
+    re-tokenizing. Returns the CachedContent, or None if the model or the
+    content size does not support caching.
+    """
+    try:
+        cached_content = create_cached_content(model_name, contents, ttl)
+        logging.info(f"Created context cache {cached_content.name} for {model_name}.")
+        return cached_content
+    except Exception as e:
+        logging.info(f"Context caching is not available for this request, sending the content with each prompt: {e}")
+        return None
+
+def analyze_variants(model_name, variants, shared_parts, build_prompt, max_workers=4):
+    """
+    Runs one prompt per (focus, language) variant against the same media parts,
+    concurrently on up to `max_workers` threads.
+
+    The shared parts are placed in a context cache when there is more than one
+    variant and the model supports it. Returns a list of (markdown, json) tuples
+    in the order of `variants`, with (None, None) for failed variants.
+    """
+    if not configure_gemini():
+        return [(None, None)] * len(variants)
+
+    cached_content = create_context_cache(model_name, shared_parts) if len(variants) > 1 else None
+    model = genai.GenerativeModel.from_cached_content(cached_content=cached_content) if cached_content else None
+
+    def run(variant):
+        focus, language = variant
+        prompt = build_prompt(focus, language)
+        contents = [prompt] if cached_content else [prompt] + list(shared_parts)
+        try:
+            response = generate_content(model_name, contents, model)
+            full_markdown = response.text
+            json_data = parse_json_from_markdown(full_markdown)
+            logging.info(f"Successfully received and parsed response from Gemini (focus: {focus}, language: {language}).")
+            return full_markdown, json_data
+        except Exception as e:
+            logging.error(f"An error occurred during the Gemini API call (focus: {focus}, language: {language}): {e}")
+            return None, None
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(variants)))) as executor:
+            return list(executor.map(metrics.propagate(run), variants))
+    finally:
+        if cached_content:
+            try:
+                cached_content.delete()
+            except Exception as e:
+                logging.warning(f"Failed to delete context cache {cached_content.name}: {e}")
+
+def analyze_frames_variants(frames, model_name, variants, max_workers=4):
+    """Analyzes one list of frames with several (focus, language) variants. See analyze_variants."""
+    image_parts = [
+        {"mime_type": "image/jpeg", "data": frame[1] if isinstance(frame, tuple) else frame}
+        for frame in frames
+    ]
+    if not image_parts:
+        logging.warning("No frames were provided for analysis.")
+        return [(None, None)] * len(variants)
+    logging.info(f"Analyzing {len(image_parts)} frames with {model_name} for {len(variants)} variants...")
+    return analyze_variants(model_name, variants, image_parts, build_frames_prompt, max_workers)
+
+def analyze_video_variants(video_path, model_name, variants, video_hash, registry, max_workers=4):
+    """
+    Analyzes one uploaded video with several (focus, language) variants. The
+    video is acquired from the registry once and held until every variant is done.
+    """
+    if not configure_gemini():
+        return [(None, None)] * len(variants)
+
+    video_file = registry.acquire(video_path, video_hash)
+    if not video_file:
+        logging.error(f"Video processing failed for {video_path}.")
+        return [(None, None)] * len(variants)
+    try:
+        logging.info(f"Analyzing video and audio with {model_name} for {len(variants)} variants...")
+        return analyze_variants(model_name, variants, [video_file], build_video_prompt, max_workers)
+    finally:
+        registry.release(video_hash)
+
+def format_timestamp(seconds):
+    """Formats a number of seconds as HH:MM:SS."""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def build_window_prompt(focus, language, window_start, window_end):
+    """Builds the map-step prompt for one time window of frames."""
     prompt_parts = [
-        "You are an expert in behavioral analysis, skilled in interpreting both visual and auditory cues.",
-        "Analyze the provided video file, paying attention to both the visual elements and the audio track."
+        "You are an expert in behavioral analysis and non-verbal communication.",
+        f"Analyze the provided sequence of images, which are frames from the part of a video between {format_timestamp(window_start)} and {format_timestamp(window_end)}."
     ]
     if focus:
         prompt_parts.append(f"Your analysis should focus on: {focus}.")
     else:
-        prompt_parts.append("Focus on the primary individual visible and audible in the video.")
+        prompt_parts.append("Focus on the primary individual visible in the frames.")
+
+    prompt_parts.append("Based on their facial expressions, body language, posture, and any discernible gestures, summarize what happens in this part of the video.")
+
+    if language:
+        prompt_parts.append(f"All text values must be written in {language}.")
+
+    prompt_parts.append("""
+Respond only with a JSON object enclosed in a Markdown code block like this:
+```json
+{
+  "emotional_state": "...",
+  "sentiment": {
+    "classification": "...",
+    "justification": "..."
+  },
+  "confidence_level": "...",
+  "key_observations": [
+    {"type": "facial_expression", "detail": "..."},
+    {"type": "body_language", "detail": "..."}
+  ]
+}
+```
+""")
+    return "\n".join(prompt_parts)
+
+def build_reduce_prompt(window_results, focus, language, media_description="sequence of video frames"):
+    """
+    Builds the reduce-step prompt that merges per-window JSON findings into a
+    single report with the same sections and JSON schema as a single-pass analysis.
+    """
+    prompt_parts = [
+        "You are an expert in behavioral analysis and non-verbal communication.",
+        f"A {media_description} was split into consecutive time windows and each window was analyzed separately.",
+        "The per-window findings are given below as JSON, in chronological order. Each observation carries the window_start and window_end of its window, in seconds from the start of the video."
+    ]
+    if focus:
+        prompt_parts.append(f"The analysis focuses on: {focus}.")
+
+    prompt_parts.append("Merge these findings into one comprehensive report in Markdown format that describes how the person's state develops over the whole video.")
 
-    prompt_parts.append("Based on their facial expressions, body language, gestures, tone of voice, and speech patterns, please provide a comprehensive report in Markdown format.")
-    
     if language:
         prompt_parts.append(f"The report must be written in {language}.")
 
@@ -157,23 +563,156 @@ def analyze_video_with_gemini(video_path, model_name, focus, language):
 The report should include the following sections:
 
 ## Overall Emotional State
-- A summary of the person's dominant emotional state, considering both visual and auditory cues.
+- A summary of the person's dominant emotional state throughout the video, noting any changes over time.
 
 ## Sentiment Analysis
-- Classify the overall sentiment as Positive, Negative, or Neutral, justifying your answer with evidence from both video and audio.
+- Classify the overall sentiment as Positive, Negative, or Neutral, and provide a brief justification.
 
 ## Detailed Observations
-- **Visual Cues:** Describe specific facial expressions, posture, and body movements (e.g., fidgeting, leaning forward, breaking eye contact).
-- **Auditory Cues:** Describe the tone of voice (e.g., wavering, confident, monotone), pace of speech, use of filler words, and any notable pauses or hesitations.
-- **Potential Inferred Feelings:** Infer potential feelings (e.g., nervousness, confidence, deception, honesty) and support your inferences with specific, timestamped examples from the video if possible.
+- The most significant observations, each with the time window in which it occurred.
 
 ## Confidence Level
-- Assess the person's apparent confidence level on a scale of Low, Medium, or High, explaining your reasoning based on both visual and auditory evidence.
+- Assess the person's apparent confidence level on a scale of Low, Medium, or High, explaining your reasoning.
 
 ## Summary
-- Conclude with a brief, holistic summary of your findings.
+- Conclude with a brief summary of your findings.
 
-Finally, after the summary, provide a JSON object containing the key findings. The JSON object should be enclosed in a Markdown code block like this:
+Finally, after the summary, provide a JSON object containing the key findings. Keep the window_start and window_end values of every observation you include. The JSON object should be enclosed in a Markdown code block like this:
+```json
+{
+  "emotional_state": "...",
+  "sentiment": {
+    "classification": "...",
+    "justification": "..."
+  },
+  "confidence_level": "...",
+  "key_observations": [
+    {"type": "...", "detail": "...", "window_start": 0, "window_end": 60}
+  ]
+}
+```
+""")
+    prompt_parts.append("Per-window findings:")
+    prompt_parts.append(json.dumps(window_results, indent=2, ensure_ascii=False))
+    return "\n".join(prompt_parts)
+
+def _annotate_window_result(window_json, window_start, window_end):
+    """Stamps a window's JSON findings and each of its observations with the window bounds."""
+    result = {"window_start": window_start, "window_end": window_end}
+    result.update(window_json)
+    observations = result.get("key_observations")
+    if isinstance(observations, list):
+        result["key_observations"] = [
+            {**obs, "window_start": window_start, "window_end": window_end} if isinstance(obs, dict) else obs
+            for obs in observations
+        ]
+    return result
+
+def _analyze_window(model_name, focus, language, window_start, window_end, jpeg_frames):
+    """Map step: analyzes one window of frames and returns its annotated JSON findings."""
+    label = f"{format_timestamp(window_start)}-{format_timestamp(window_end)}"
+    prompt = build_window_prompt(focus, language, window_start, window_end)
+    image_parts = [{"mime_type": "image/jpeg", "data": jpeg} for jpeg in jpeg_frames]
+    try:
+        response = generate_content(model_name, [prompt] + image_parts)
+        window_json = parse_json_from_markdown(response.text)
+    except Exception as e:
+        logging.error(f"An error occurred while analyzing window {label}: {e}")
+        return None
+    if not isinstance(window_json, dict):
+        logging.warning(f"Window {label} did not return usable JSON findings.")
+        return None
+    logging.info(f"Analyzed window {label} ({len(jpeg_frames)} frames).")
+    return _annotate_window_result(window_json, window_start, window_end)
+
+def _iter_windows(frames, window_sec):
+    """Groups a stream of (timestamp_sec, jpeg_bytes) tuples into (start, end, [jpeg_bytes]) windows."""
+    window_index = None
+    window_frames = []
+    last_timestamp = 0
+    for timestamp, jpeg in frames:
+        index = int(timestamp // window_sec)
+        if window_frames and index != window_index:
+            yield window_index * window_sec, (window_index + 1) * window_sec, window_frames
+            window_frames = []
+        window_index = index
+        window_frames.append(jpeg)
+        last_timestamp = timestamp
+    if window_frames:
+        yield window_index * window_sec, max(last_timestamp, window_index * window_sec), window_frames
+
+def reduce_window_results(model_name, window_results, focus, language, media_description="sequence of video frames"):
+    """
+    Reduce step: merges per-window findings into the full Markdown report and
+    its JSON object. The per-window findings are kept under the "windows" key.
+    """
+    prompt = build_reduce_prompt(window_results, focus, language, media_description)
+    try:
+        response = generate_content(model_name, prompt)
+        full_markdown = response.text
+    except Exception as e:
+        logging.error(f"An error occurred while merging window results: {e}")
+        return None, None
+
+    json_data = parse_json_from_markdown(full_markdown)
+    if json_data is not None:
+        json_data["windows"] = window_results
+    logging.info(f"Merged {len(window_results)} window analyses into the final report.")
+    return full_markdown, json_data
+
+def analyze_frames_windowed(frames, model_name, focus, language, window_sec, max_workers=4):
+    """
+    Analyzes a long stream of frames with a map-reduce over time windows.
+
+    Frames are grouped into windows of `window_sec` seconds, each window is
+    analyzed by its own request on a pool of `max_workers` threads, and a final
+    text-only request merges the per-window JSON into the usual report. At most
+    `max_workers` windows are held in memory at any time.
+    """
+    if not configure_gemini():
+        return None, None
+
+    max_workers = max(1, max_workers)
+    logging.info(f"Analyzing frames with {model_name} in {window_sec}s windows ({max_workers} workers)...")
+
+    window_results = []
+    pending = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for window_start, window_end, jpeg_frames in _iter_windows(frames or [], window_sec):
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                window_results.extend(f.result() for f in done)
+            pending.add(executor.submit(metrics.propagate(_analyze_window), model_name, focus, language, window_start, window_end, jpeg_frames))
+        window_results.extend(f.result() for f in as_completed(pending))
+
+    total_windows = len(window_results)
+    window_results = sorted((r for r in window_results if r), key=lambda r: r["window_start"])
+    if not window_results:
+        logging.warning("No windows were analyzed successfully.")
+        return None, None
+    if len(window_results) < total_windows:
+        logging.warning(f"{total_windows - len(window_results)} of {total_windows} windows failed and are missing from the report.")
+
+    return reduce_window_results(model_name, window_results, focus, language)
+
+def build_segment_prompt(focus, language, segment_start, segment_end):
+    """Builds the map-step prompt for one segment of a video, including its audio."""
+    prompt_parts = [
+        "You are an expert in behavioral analysis, skilled in interpreting both visual and auditory cues.",
+        f"Analyze the provided video clip, which is the part of a longer video between {format_timestamp(segment_start)} and {format_timestamp(segment_end)}, paying attention to both the visual elements and the audio track."
+    ]
+    if focus:
+        prompt_parts.append(f"Your analysis should focus on: {focus}.")
+    else:
+        prompt_parts.append("Focus on the primary individual visible and audible in the video.")
+
+    prompt_parts.append("Based on their facial expressions, body language, gestures, tone of voice, and speech patterns, summarize what happens in this clip.")
+
+    if language:
+        prompt_parts.append(f"All text values must be written in {language}.")
+
+    prompt_parts.append("""
+Respond only with a JSON object enclosed in a Markdown code block like this:
 ```json
 {
   "emotional_state": "...",
@@ -189,20 +728,66 @@ Finally, after the summary, provide a JSON object containing the key findings. T
 }
 ```
 """)
-    
-    prompt = "\n".join(prompt_parts)
+    return "\n".join(prompt_parts)
 
+def _analyze_segment(model_name, focus, language, segment_start, segment_end, video_file):
+    """Map step: analyzes one uploaded segment and returns its annotated JSON findings."""
+    label = f"{format_timestamp(segment_start)}-{format_timestamp(segment_end)}"
+    prompt = build_segment_prompt(focus, language, segment_start, segment_end)
     try:
-        response = model.generate_content([prompt, video_file])
-        full_markdown = response.text
-        json_data = parse_json_from_markdown(full_markdown)
-        
-        # Clean up the uploaded file
-        genai.delete_file(video_file.name)
-        logging.info(f"Cleaned up uploaded file: {video_file.name}")
-        
-        logging.info("Successfully received and parsed response from Gemini.")
-        return full_markdown, json_data
+        response = generate_content(model_name, [prompt, video_file])
+        segment_json = parse_json_from_markdown(response.text)
     except Exception as e:
-        logging.error(f"An error occurred during the Gemini API call: {e}")
-        return None, None
\ No newline at end of file
+        logging.error(f"An error occurred while analyzing segment {label}: {e}")
+        return None
+    if not isinstance(segment_json, dict):
+        logging.warning(f"Segment {label} did not return usable JSON findings.")
+        return None
+    logging.info(f"Analyzed segment {label}.")
+    return _annotate_window_result(segment_json, segment_start, segment_end)
+
+def analyze_video_segmented(segments, model_name, variants, max_workers=4, upload_timeout=600):
+    """
+    Analyzes a long video as separately uploaded segments.
+
+    `segments` is a list of (segment_path, start_sec, end_sec) tuples, with
+    times on the original video's timeline. All segments are uploaded in
+    parallel, then for each (focus, language) variant every segment is
+    analyzed concurrently on up to `max_workers` threads and the per-segment
+    findings are merged into one report by reduce_window_results. Uploaded
+    segments are deleted afterwards. Returns a list of (markdown, json) tuples
+    in the order of `variants`.
+    """
+    if not configure_gemini():
+        return [(None, None)] * len(variants)
+
+    max_workers = max(1, max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        uploads = list(executor.map(metrics.propagate(lambda segment: upload_video_file(segment[0], upload_timeout)), segments))
+    try:
+        if not all(uploads):
+            logging.error("One or more segments failed to upload. Skipping segmented analysis.")
+            return [(None, None)] * len(variants)
+
+        results = []
+        for focus, language in variants:
+            logging.info(f"Analyzing {len(segments)} segments with {model_name}...")
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                segment_results = list(executor.map(
+                    metrics.propagate(lambda item: _analyze_segment(model_name, focus, language, item[0][1], item[0][2], item[1])),
+                    zip(segments, uploads)
+                ))
+            failed = sum(1 for r in segment_results if not r)
+            segment_results = [r for r in segment_results if r]
+            if not segment_results:
+                logging.warning("No segments were analyzed successfully.")
+                results.append((None, None))
+                continue
+            if failed:
+                logging.warning(f"{failed} of {len(segments)} segments failed and are missing from the report.")
+            results.append(reduce_window_results(model_name, segment_results, focus, language, "video with audio"))
+        return results
+    finally:
+        for video_file in uploads:
+            if video_file:
+                delete_video_file(video_file.name)
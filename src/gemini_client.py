@@ -0,0 +1,322 @@
+import os
+import re
+import time
+import random
+import itertools
+import logging
+import threading
+import google.generativeai as genai
+from google.generativeai import caching
+from google.api_core import exceptions as google_exceptions
+from dotenv import load_dotenv
+
+from src import metrics
+
+# Defaults for retrying transient Gemini errors: attempts after the first
+# one, and the base and cap of the exponential backoff in seconds.
+DEFAULT_MAX_RETRIES = 3
+RETRY_BASE_DELAY = 2.0
+RETRY_MAX_DELAY = 60.0
+
+# Rough request-size estimate used to reserve tokens-per-minute quota before a
+# request is sent; the actual usage reported by the API is charged afterwards.
+CHARS_PER_TOKEN = 4
+MIN_IMAGE_TOKENS = 258
+
+# Errors worth retrying: rate limits, server-side failures and timeouts.
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+_lock = threading.Lock()
+_configured = False
+_models = {}
+_limiters = {}
+_settings = {"rpm": None, "tpm": None, "max_retries": DEFAULT_MAX_RETRIES}
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled continuously at `rate_per_minute`,
+    holding at most one minute's worth of tokens.
+
+    acquire() blocks until the requested amount is available; amounts larger
+    than the capacity wait for a full bucket. charge() debits tokens without
+    waiting and may leave the bucket in debt, which delays later callers.
+    """
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Waits until `amount` tokens are available and takes them. Returns the seconds waited."""
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def charge(self, amount):
+        """Takes `amount` tokens (or returns them, if negative) without waiting."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one model. Either limit may be None (unlimited)."""
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    def acquire(self, estimated_tokens):
+        """Blocks until one request and `estimated_tokens` tokens fit within the limits."""
+        waited = 0.0
+        if self.requests:
+            waited += self.requests.acquire(1)
+        if self.tokens:
+            waited += self.tokens.acquire(estimated_tokens)
+        return waited
+
+    def reconcile(self, estimated_tokens, actual_tokens):
+        """Charges the difference between a request's estimated and actual token usage."""
+        if self.tokens and actual_tokens is not None:
+            self.tokens.charge(actual_tokens - estimated_tokens)
+
+def configure_gemini():
+    """
+    Loads the API key from the environment and configures the Gemini client.
+    Only the first successful call does any work; later calls return True.
+    """
+    global _configured
+    with _lock:
+        if _configured:
+            return True
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            logging.critical("GEMINI_API_KEY not found. Please set it in a .env file.")
+            return False
+        genai.configure(api_key=api_key)
+        _configured = True
+        return True
+
+def configure_limits(rpm=None, tpm=None, max_retries=DEFAULT_MAX_RETRIES):
+    """
+    Sets the per-model requests-per-minute and tokens-per-minute limits and the
+    number of retries for transient errors. Existing limiters are replaced.
+    """
+    with _lock:
+        _settings.update({"rpm": rpm, "tpm": tpm, "max_retries": max_retries})
+        _limiters.clear()
+
+def get_model(model_name):
+    """Returns the shared GenerativeModel for `model_name`, creating it on first use."""
+    with _lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = _models[model_name] = genai.GenerativeModel(f'models/{model_name}')
+        return model
+
+def get_limiter(model_name):
+    """Returns the RateLimiter shared by all requests to `model_name`."""
+    with _lock:
+        limiter = _limiters.get(model_name)
+        if limiter is None:
+            limiter = _limiters[model_name] = RateLimiter(_settings["rpm"], _settings["tpm"])
+        return limiter
+
+def estimate_request_tokens(contents):
+    """
+    Estimates the input tokens of a request from its text length and number of
+    images. Uploaded files are not counted; their usage is charged once the
+    response reports it.
+    """
+    parts = contents if isinstance(contents, list) else [contents]
+    tokens = 0
+    for part in parts:
+        if isinstance(part, str):
+            tokens += len(part) // CHARS_PER_TOKEN
+        elif isinstance(part, dict) and "data" in part:
+            tokens += MIN_IMAGE_TOKENS
+    return max(1, tokens)
+
+def retry_after_seconds(error):
+    """
+    Returns the server's suggested retry delay for an error in seconds, from a
+    Retry-After header, a RetryInfo detail or the error message, or None.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value is not None:
+            return float(value)
+    except (TypeError, ValueError, AttributeError):
+        pass
+    for detail in getattr(error, "details", None) or []:
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+    match = re.search(r"retry(?:_delay)?[^0-9]{0,20}?(\d+(?:\.\d+)?)\s*s", str(error), re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return None
+
+def backoff_delay(attempt, retry_after=None):
+    """Returns the delay before retry number `attempt` (0-based): full-jitter exponential backoff, at least `retry_after`."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, 1))
+    return delay
+
+def call_with_retries(description, fn, *args, **kwargs):
+    """
+    Calls a Gemini API function that is not a generation request (file
+    upload, lookup and deletion, context caching), retrying transient errors
+    with the same jittered backoff as generate_content. Raises the last error
+    if all attempts fail.
+    """
+    max_retries = _settings["max_retries"]
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, retry_after_seconds(e))
+            logging.warning(f"{description} failed ({e}). Retrying in {delay:.1f}s (attempt {attempt + 2} of {max_retries + 1})...")
+            time.sleep(delay)
+
+def upload_file(path):
+    """Uploads a file to the Gemini Files API, retrying transient errors."""
+    return call_with_retries(f"Upload of {os.path.basename(path)}", genai.upload_file, path=path)
+
+def get_file(name):
+    """Fetches the current state of an uploaded file, retrying transient errors."""
+    return call_with_retries(f"Lookup of {name}", genai.get_file, name)
+
+def delete_file(name):
+    """Deletes an uploaded file, retrying transient errors."""
+    return call_with_retries(f"Deletion of {name}", genai.delete_file, name)
+
+def create_cached_content(model_name, contents, ttl):
+    """Creates a context cache for `model_name`, retrying transient errors."""
+    return call_with_retries(
+        f"Context cache creation for {model_name}", caching.CachedContent.create,
+        model=f'models/{model_name}', contents=contents, ttl=ttl,
+    )
+
+def generate_content(model_name, contents, model=None):
+    """
+    Sends one generate_content request for `model_name` through the shared rate
+    limiter, retrying transient errors with jittered backoff.
+
+    `model` overrides the shared model, e.g. one bound to a context cache; the
+    request still counts against `model_name`'s limits. Raises the last error if
+    all attempts fail. The request is recorded as a 'generate' metrics span
+    with its retries, rate-limit wait and token usage.
+    """
+    model = model or get_model(model_name)
+    limiter = get_limiter(model_name)
+    max_retries = _settings["max_retries"]
+    estimated_tokens = estimate_request_tokens(contents)
+    with metrics.span("generate", model=model_name, retries=0, rate_limit_wait_sec=0.0) as span:
+        for attempt in range(max_retries + 1):
+            waited = limiter.acquire(estimated_tokens)
+            span["rate_limit_wait_sec"] = round(span["rate_limit_wait_sec"] + waited, 3)
+            if waited >= 1:
+                logging.info(f"Rate limit for {model_name}: waited {waited:.1f}s before sending the request.")
+            try:
+                response = model.generate_content(contents)
+            except Exception as e:
+                # A failed attempt used no tokens; return its reservation.
+                limiter.reconcile(estimated_tokens, 0)
+                if not isinstance(e, RETRYABLE_ERRORS) or attempt == max_retries:
+                    raise
+                delay = backoff_delay(attempt, retry_after_seconds(e))
+                logging.warning(f"Gemini request failed ({e}). Retrying in {delay:.1f}s (attempt {attempt + 2} of {max_retries + 1})...")
+                span["retries"] = attempt + 1
+                time.sleep(delay)
+                continue
+            usage = getattr(response, "usage_metadata", None)
+            limiter.reconcile(estimated_tokens, getattr(usage, "total_token_count", None))
+            span.update(metrics.usage_attributes(response))
+            return response
+
+def chunk_text(chunk):
+    """
+    Returns the text of a streamed response chunk. Chunks without text parts,
+    such as a final chunk that only carries the finish reason (MAX_TOKENS,
+    SAFETY) or usage metadata, give '' instead of raising like chunk.text.
+    """
+    candidates = getattr(chunk, "candidates", None)
+    if not candidates:
+        return ""
+    return "".join(part.text for part in candidates[0].content.parts if getattr(part, "text", None))
+
+def generate_content_stream(model_name, contents, model=None):
+    """
+    Streaming variant of generate_content: yields the response text chunk by
+    chunk as it arrives.
+
+    Rate limiting and retries apply until the first chunk has been received;
+    after that an error is raised to the caller, since part of the response
+    may already have been consumed. The request is recorded as a 'generate'
+    metrics span once the stream ends, including the time to first token.
+    """
+    model = model or get_model(model_name)
+    limiter = get_limiter(model_name)
+    max_retries = _settings["max_retries"]
+    estimated_tokens = estimate_request_tokens(contents)
+    started = time.monotonic()
+    retries = 0
+    for attempt in range(max_retries + 1):
+        waited = limiter.acquire(estimated_tokens)
+        if waited >= 1:
+            logging.info(f"Rate limit for {model_name}: waited {waited:.1f}s before sending the request.")
+        try:
+            response = model.generate_content(contents, stream=True)
+            chunks = iter(response)
+            first_chunk = next(chunks, None)
+        except Exception as e:
+            limiter.reconcile(estimated_tokens, 0)
+            if not isinstance(e, RETRYABLE_ERRORS) or attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt, retry_after_seconds(e))
+            logging.warning(f"Gemini request failed ({e}). Retrying in {delay:.1f}s (attempt {attempt + 2} of {max_retries + 1})...")
+            retries = attempt + 1
+            time.sleep(delay)
+            continue
+        break
+
+    first_token_sec = time.monotonic() - started
+    if first_chunk is not None:
+        for chunk in itertools.chain([first_chunk], chunks):
+            text = chunk_text(chunk)
+            if text:
+                yield text
+    usage = getattr(response, "usage_metadata", None)
+    limiter.reconcile(estimated_tokens, getattr(usage, "total_token_count", None))
+    metrics.record_span(
+        "generate", time.monotonic() - started, model=model_name, retries=retries, stream=True,
+        time_to_first_token_sec=round(first_token_sec, 3), **metrics.usage_attributes(response)
+    )
@@ -0,0 +1,257 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from src.video_processing import FRAME_BACKENDS, SAMPLERS, check_time_range, parse_time
+from src.gemini_analysis import ANALYSIS_MODES, GEMINI_MODELS
+
+def _as_list(value):
+    """Manifest focus/language values: a single string, or a list of strings in JSONL."""
+    return [str(v) for v in value] if isinstance(value, list) else [str(value)]
+
+def _choice(choices):
+    """Returns a converter that only accepts one of `choices`, the same list the command-line flag offers."""
+    def convert(value):
+        value = str(value).strip()
+        if value not in choices:
+            raise ValueError(f"'{value}' is not one of {', '.join(choices)}")
+        return value
+    return convert
+
+def _positive_int(value):
+    """Converts an integer option that must be at least 1, such as the sampling interval."""
+    number = int(value)
+    if number < 1:
+        raise ValueError(f"must be at least 1 (got {number})")
+    return number
+
+# Options a manifest item may override, with the converter applied to its value.
+# Names match the command-line flags with dashes replaced by underscores.
+MANIFEST_OPTIONS = {
+    "model": _choice(GEMINI_MODELS),
+    "analysis_mode": _choice(ANALYSIS_MODES),
+    "interval": _positive_int,
+    "focus": _as_list,
+    "language": _as_list,
+    "start": parse_time,
+    "end": parse_time,
+    "window": float,
+    "dedup": int,
+    "sampler": _choice(SAMPLERS),
+    "frame_backend": _choice(FRAME_BACKENDS),
+    "max_request_mb": float,
+    "max_request_tokens": int,
+    "segment": float,
+}
+
+def parse_manifest_item(raw, location):
+    """Converts one manifest row into (video_input, overrides), raising ValueError on bad input."""
+    item = {str(key).strip().replace("-", "_"): value for key, value in raw.items() if key is not None}
+    video_input = str(item.pop("input", "") or "").strip()
+    if not video_input:
+        raise ValueError(f"{location}: missing 'input'")
+    overrides = {}
+    for key, value in item.items():
+        if value is None or value == "":
+            continue
+        if key not in MANIFEST_OPTIONS:
+            raise ValueError(f"{location}: unknown option '{key}' (allowed: input, {', '.join(MANIFEST_OPTIONS)})")
+        try:
+            overrides[key] = MANIFEST_OPTIONS[key](value)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{location}: invalid value for '{key}': {e}")
+    try:
+        check_time_range(overrides.get("start"), overrides.get("end"))
+    except ValueError as e:
+        raise ValueError(f"{location}: {e}")
+    return video_input, overrides
+
+def load_manifest(manifest_path):
+    """
+    Reads a batch manifest and returns a list of (video_input, overrides) tuples.
+
+    A '.csv' manifest has a header row; any other file is read as JSON Lines
+    with one object per line. Each item needs an 'input' (a path or YouTube
+    URL) and may override the options in MANIFEST_OPTIONS for that input only.
+    Blank lines and JSONL lines starting with '#' are ignored. Raises
+    ValueError on malformed items.
+    """
+    items = []
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        if manifest_path.lower().endswith(".csv"):
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                if any((value or "").strip() for value in row.values() if isinstance(value, str)):
+                    items.append(parse_manifest_item(row, f"{manifest_path}:{line_number}"))
+        else:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    raw = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{manifest_path}:{line_number}: invalid JSON: {e}")
+                if isinstance(raw, str):
+                    raw = {"input": raw}
+                if not isinstance(raw, dict):
+                    raise ValueError(f"{manifest_path}:{line_number}: expected a JSON object")
+                items.append(parse_manifest_item(raw, f"{manifest_path}:{line_number}"))
+    return items
+
+class Job:
+    """
+    Progress of one input in one run. Stage transitions and the outcome are
+    written to the JobStore as they happen, so an interrupted run leaves a
+    record of how far each input got.
+    """
+
+    def __init__(self, store, job_key, video_input, attempt):
+        self.store = store
+        self.job_key = job_key
+        self.video_input = video_input
+        self.attempt = attempt
+        self.stage = None
+        self.status = "running"
+        self.error = None
+        self.output_dirs = []
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def begin(self, stage):
+        """Marks the current stage as done and starts `stage`."""
+        self._end_stage("done")
+        self.stage = stage
+        self.store._write_stage(self, "running")
+
+    def finish(self, output_dirs):
+        """Records a successful job and the report directories it produced."""
+        self._end_stage("done")
+        self.status, self.output_dirs = "done", list(output_dirs)
+        self.finished_at = time.time()
+        self.store._write_job(self)
+
+    def fail(self, error, output_dirs=()):
+        """Records a failed job, keeping the stage it failed in and any reports it did produce."""
+        self._end_stage("failed")
+        self.status, self.error, self.output_dirs = "failed", error, list(output_dirs)
+        self.finished_at = time.time()
+        self.store._write_job(self)
+
+    def _end_stage(self, status):
+        if self.stage:
+            self.store._write_stage(self, status, finished=True)
+
+class JobStore:
+    """
+    Durable job state for batch runs, in a SQLite database.
+
+    The 'jobs' table has one row per job key (an input together with the
+    options that determine its analysis) with its status, the stage reached,
+    the last error and its report directories. The 'stages' table records
+    when each stage of each attempt started and finished. The store can be
+    shared by the threads of a run and by concurrent runs.
+    """
+
+    def __init__(self, db_path):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_key TEXT PRIMARY KEY, input TEXT NOT NULL, options TEXT NOT NULL, status TEXT NOT NULL, "
+                "stage TEXT, error TEXT, output_dirs TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, finished_at REAL)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS stages ("
+                "job_key TEXT NOT NULL, attempt INTEGER NOT NULL, stage TEXT NOT NULL, status TEXT NOT NULL, "
+                "started_at REAL NOT NULL, finished_at REAL, PRIMARY KEY (job_key, attempt, stage))"
+            )
+
+    def get(self, job_key):
+        """Returns a job's row as a dict, with output_dirs decoded, or None if it has never run."""
+        with self.lock:
+            cursor = self.connection.execute("SELECT * FROM jobs WHERE job_key = ?", (job_key,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            job = dict(zip([column[0] for column in cursor.description], row))
+        job["output_dirs"] = json.loads(job["output_dirs"] or "[]")
+        return job
+
+    def start(self, job_key, video_input, options):
+        """Registers a new attempt of a job and returns its Job handle."""
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO jobs (job_key, input, options, status, attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'running', 1, ?, ?) "
+                "ON CONFLICT(job_key) DO UPDATE SET status = 'running', stage = NULL, error = NULL, "
+                "attempts = attempts + 1, updated_at = excluded.updated_at, finished_at = NULL",
+                (job_key, video_input, json.dumps(options, sort_keys=True, ensure_ascii=False), now, now),
+            )
+            attempt = self.connection.execute("SELECT attempts FROM jobs WHERE job_key = ?", (job_key,)).fetchone()[0]
+        return Job(self, job_key, video_input, attempt)
+
+    def _write_stage(self, job, status, finished=False):
+        now = time.time()
+        with self.lock:
+            if finished:
+                self.connection.execute(
+                    "UPDATE stages SET status = ?, finished_at = ? WHERE job_key = ? AND attempt = ? AND stage = ?",
+                    (status, now, job.job_key, job.attempt, job.stage),
+                )
+            else:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO stages (job_key, attempt, stage, status, started_at) VALUES (?, ?, ?, ?, ?)",
+                    (job.job_key, job.attempt, job.stage, status, now),
+                )
+                self.connection.execute(
+                    "UPDATE jobs SET stage = ?, updated_at = ? WHERE job_key = ?", (job.stage, now, job.job_key)
+                )
+
+    def _write_job(self, job):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, output_dirs = ?, updated_at = ?, finished_at = ? WHERE job_key = ?",
+                (job.status, job.error, json.dumps(job.output_dirs), job.finished_at, job.finished_at, job.job_key),
+            )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def format_duration(seconds):
+    """Formats a duration in seconds as e.g. '1h 02m 03s', '2m 03s' or '4.5s'."""
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s" if hours else f"{minutes}m {seconds:02d}s"
+
+def log_run_summary(outcomes, elapsed):
+    """
+    Logs the end-of-run summary: counts of completed, skipped and failed
+    inputs, throughput, and the stage and error of every failure. `outcomes`
+    is a list of dicts with 'input', 'status' ('done', 'skipped' or
+    'failed'), 'stage', 'error' and 'output_dirs'.
+    """
+    done = [o for o in outcomes if o["status"] == "done"]
+    skipped = [o for o in outcomes if o["status"] == "skipped"]
+    failed = [o for o in outcomes if o["status"] == "failed"]
+    reports = sum(len(o["output_dirs"]) for o in done)
+    processed = len(done) + len(failed)
+    rate = f", {len(done) / elapsed * 3600:.1f} videos/hour" if done and elapsed > 0 else ""
+    logging.info(
+        f"Run summary: {len(outcomes)} inputs, {len(done)} completed, {len(skipped)} skipped (already completed), "
+        f"{len(failed)} failed; {reports} reports written. {processed} inputs processed in {format_duration(elapsed)}{rate}."
+    )
+    for outcome in failed:
+        stage = f" at stage '{outcome['stage']}'" if outcome.get("stage") else ""
+        logging.warning(f"Failed{stage}: {outcome['input']}: {outcome.get('error') or 'unknown error'}")
@@ -0,0 +1,269 @@
+import os
+import io
+import re
+import json
+import time
+import pstats
+import logging
+import cProfile
+import datetime
+import threading
+import contextvars
+import tracemalloc
+from contextlib import contextmanager
+
+from src.cache import atomic_write
+
+# Prefix of every exported Prometheus metric name.
+PROMETHEUS_PREFIX = "video_analyzer"
+
+# Number of allocation sites listed in a tracemalloc profile.
+TRACEMALLOC_TOP = 25
+
+# The VideoMetrics of the video whose work is running in the current context.
+_current_video = contextvars.ContextVar("current_video_metrics", default=None)
+
+class MetricsRegistry:
+    """
+    Collects the stage spans of a run. Each span is appended to a JSON Lines
+    file as soon as it ends, and per-stage totals are kept for the Prometheus
+    textfile, which is rewritten after every video.
+    """
+
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.run_id = datetime.datetime.now().strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+        self.lock = threading.Lock()
+        self.stage_totals = {}
+        self.token_totals = {}
+        self.video_totals = {}
+        if jsonl_path:
+            os.makedirs(os.path.dirname(jsonl_path) or ".", exist_ok=True)
+
+    def write_record(self, record):
+        """Appends one record to the JSON Lines file."""
+        if not self.jsonl_path:
+            return
+        line = json.dumps({"run_id": self.run_id, **record}, default=str, ensure_ascii=False)
+        with self.lock:
+            try:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                logging.warning(f"Failed to write metrics to {self.jsonl_path}: {e}")
+
+    def add_span(self, video_input, stage, record):
+        """Records a finished stage span and adds it to the per-stage totals."""
+        with self.lock:
+            totals = self.stage_totals.setdefault(stage, {"count": 0, "seconds": 0.0, "bytes": 0, "frames": 0, "errors": 0})
+            totals["count"] += 1
+            totals["seconds"] += record["duration_sec"]
+            totals["bytes"] += record.get("bytes") or 0
+            totals["frames"] += record.get("frames") or 0
+            totals["errors"] += 1 if record.get("error") else 0
+            model = record.get("model")
+            if model:
+                for kind in ("prompt_tokens", "output_tokens", "cached_tokens"):
+                    if record.get(kind):
+                        key = (model, kind.replace("_tokens", ""))
+                        self.token_totals[key] = self.token_totals.get(key, 0) + record[kind]
+        self.write_record({"type": "span", "video": video_input, "stage": stage, **record})
+
+    def add_video(self, video_input, status, duration, stage_seconds):
+        """Records the outcome of one video and refreshes the Prometheus textfile."""
+        with self.lock:
+            totals = self.video_totals.setdefault(status, {"count": 0, "seconds": 0.0})
+            totals["count"] += 1
+            totals["seconds"] += duration
+        self.write_record({
+            "type": "video", "video": video_input, "status": status,
+            "duration_sec": round(duration, 4), "stage_seconds": {k: round(v, 4) for k, v in stage_seconds.items()},
+        })
+        self.write_prometheus()
+
+    def write_prometheus(self):
+        """Rewrites the Prometheus textfile (node_exporter textfile collector format) atomically."""
+        if not self.prometheus_path:
+            return
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}")
+
+        with self.lock:
+            stages = sorted(self.stage_totals.items())
+            metric("stage_seconds_total", "counter", "Time spent in each pipeline stage.",
+                   [({"stage": s}, round(t["seconds"], 6)) for s, t in stages])
+            metric("stage_runs_total", "counter", "Number of times each pipeline stage ran.",
+                   [({"stage": s}, t["count"]) for s, t in stages])
+            metric("stage_errors_total", "counter", "Number of pipeline stage runs that raised an error.",
+                   [({"stage": s}, t["errors"]) for s, t in stages])
+            metric("stage_bytes_total", "counter", "Bytes processed by each pipeline stage.",
+                   [({"stage": s}, t["bytes"]) for s, t in stages if t["bytes"]])
+            metric("stage_frames_total", "counter", "Frames processed by each pipeline stage.",
+                   [({"stage": s}, t["frames"]) for s, t in stages if t["frames"]])
+            metric("tokens_total", "counter", "Gemini tokens reported in response usage metadata.",
+                   [({"model": m, "kind": k}, v) for (m, k), v in sorted(self.token_totals.items())])
+            metric("videos_total", "counter", "Videos processed, by outcome.",
+                   [({"status": s}, t["count"]) for s, t in sorted(self.video_totals.items())])
+            metric("video_seconds_total", "counter", "Wall-clock time spent processing videos, by outcome.",
+                   [({"status": s}, round(t["seconds"], 6)) for s, t in sorted(self.video_totals.items())])
+            metric("last_update_timestamp_seconds", "gauge", "Time this file was last written.",
+                   [({"run_id": self.run_id}, round(time.time(), 3))])
+        try:
+            atomic_write(self.prometheus_path, ("\n".join(lines) + "\n").encode("utf-8"))
+        except OSError as e:
+            logging.warning(f"Failed to write Prometheus metrics to {self.prometheus_path}: {e}")
+
+_registry = None
+
+def configure_metrics(jsonl_path=None, prometheus_path=None):
+    """Enables metrics collection for this process. With neither path set, spans are not recorded."""
+    global _registry
+    _registry = MetricsRegistry(jsonl_path, prometheus_path) if jsonl_path or prometheus_path else None
+    return _registry
+
+class VideoMetrics:
+    """The spans of one video, attributed to it through a context variable while it is processed."""
+
+    def __init__(self, registry, video_input):
+        self.registry = registry
+        self.video_input = video_input
+        self.stage_seconds = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, record):
+        with self.lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + record["duration_sec"]
+        self.registry.add_span(self.video_input, stage, record)
+
+@contextmanager
+def video_scope(video_input):
+    """
+    Attributes all spans recorded in this context (and in work started with
+    propagate) to `video_input`, and records the video's outcome at the end.
+    Yields a dict in which the caller may set 'status'.
+    """
+    outcome = {"status": "done"}
+    if _registry is None:
+        yield outcome
+        return
+    video = VideoMetrics(_registry, video_input)
+    token = _current_video.set(video)
+    started = time.monotonic()
+    try:
+        yield outcome
+    except BaseException:
+        outcome["status"] = "error"
+        raise
+    finally:
+        _current_video.reset(token)
+        _registry.add_video(video_input, outcome["status"], time.monotonic() - started, video.stage_seconds)
+
+def record_span(stage, duration, **attributes):
+    """Records an already measured span for the current video. Attributes with None values are omitted."""
+    video = _current_video.get()
+    if video is None:
+        return
+    record = {"start": round(time.time() - duration, 3), "duration_sec": round(duration, 6), "thread": threading.current_thread().name}
+    record.update({k: v for k, v in attributes.items() if v is not None})
+    video.add(stage, record)
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Times the enclosed block as a stage span of the current video. Yields a
+    dict to which the block can add attributes such as 'bytes', 'frames' or
+    token counts. Errors are recorded on the span and re-raised.
+    """
+    attributes = dict(attributes)
+    if _current_video.get() is None:
+        yield attributes
+        return
+    started = time.monotonic()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        record_span(stage, time.monotonic() - started, **attributes)
+
+def propagate(fn):
+    """
+    Wraps `fn` so that, when it runs on another thread, its spans are still
+    attributed to the video that is current where propagate was called.
+    """
+    video = _current_video.get()
+
+    def run(*args, **kwargs):
+        token = _current_video.set(video)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_video.reset(token)
+    return run
+
+def usage_attributes(response):
+    """Extracts token counts from a Gemini response's usage_metadata as span attributes."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+        "cached_tokens": getattr(usage, "cached_content_token_count", None) or None,
+        "total_tokens": getattr(usage, "total_token_count", None),
+    }
+
+def profile_name(video_input):
+    """Returns a filesystem-safe name for profiles of `video_input`."""
+    name = os.path.splitext(os.path.basename(video_input.rstrip("/")))[0] or "video"
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name)[:60]
+
+@contextmanager
+def profile(name, output_dir, memory=False):
+    """
+    Profiles the enclosed block with cProfile, writing `<name>.prof` (for
+    pstats or snakeviz) and a text summary of the top functions by
+    cumulative time to `output_dir`. With `memory`, tracemalloc also runs and
+    the peak traced memory and the top allocation sites are written to
+    `<name>.memory.txt`. cProfile only sees the calling thread; tracemalloc
+    sees every thread.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.join(output_dir, name)
+    started_tracing = memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    if memory:
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(base_path + ".prof")
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(40)
+        with open(base_path + ".txt", "w") as f:
+            f.write(summary.getvalue())
+        logging.info(f"CPU profile saved to: {base_path}.prof")
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            diff = tracemalloc.take_snapshot().compare_to(before, "lineno")
+            with open(base_path + ".memory.txt", "w") as f:
+                f.write(f"Peak traced memory: {peak / 1e6:.1f} MB\nTraced memory at end: {current / 1e6:.1f} MB\n\n")
+                f.write(f"Top {TRACEMALLOC_TOP} allocation sites by size difference:\n")
+                for stat in diff[:TRACEMALLOC_TOP]:
+                    f.write(f"{stat}\n")
+            if started_tracing:
+                tracemalloc.stop()
+            logging.info(f"Memory profile saved to: {base_path}.memory.txt (peak {peak / 1e6:.1f} MB)")
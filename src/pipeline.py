@@ -0,0 +1,560 @@
+import os
+import shutil
+import argparse
+import hashlib
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.video_processing import (
+    iter_frames,
+    prefetch,
+    get_video_hash,
+    is_youtube_url,
+    youtube_video_id,
+    download_youtube_video,
+    convert_to_mp4,
+    trim_video,
+    split_video_segments,
+    make_scratch_dir,
+    plan_frame_encoding,
+    DEFAULT_JPEG_QUALITY,
+    TEMP_DIR
+)
+from src.gemini_analysis import (
+    analyze_frames_with_gemini,
+    analyze_frames_windowed,
+    analyze_video_with_gemini,
+    analyze_frames_variants,
+    analyze_video_variants,
+    analyze_video_segmented,
+    UploadRegistry,
+    build_frames_prompt,
+    build_video_prompt,
+    build_window_prompt,
+    build_segment_prompt,
+    build_reduce_prompt
+)
+from src import metrics
+from src.gemini_client import configure_limits
+from src.report_generation import create_output_directory, save_reports, StreamingReportWriter
+from src.report_index import ReportIndex
+from src.cache import ResultCache, MediaCache, HashCache, make_cache_key
+from src.jobs import JobStore, log_run_summary
+
+def make_stage_limits(args):
+    """
+    Creates one semaphore per pipeline stage, bounding how many videos can be
+    in that stage at once: downloading, converting, and analyzing with Gemini
+    (frame extraction and upload included).
+    """
+    return {
+        "download": threading.BoundedSemaphore(max(1, args.download_workers)),
+        "convert": threading.BoundedSemaphore(max(1, args.convert_workers)),
+        "analyze": threading.BoundedSemaphore(max(1, args.analysis_workers)),
+    }
+
+class PipelineContext:
+    """
+    Resources shared by every video in a run: stage limits, caches, the upload
+    registry, the job store, the report index and a scratch directory that belongs to this run only.
+    """
+
+    def __init__(self, args):
+        self.limits = make_stage_limits(args)
+        configure_limits(args.rpm, args.tpm, args.max_retries)
+        metrics.configure_metrics(args.metrics_jsonl, args.metrics_prom)
+        self.result_cache = None
+        if not args.no_cache:
+            max_bytes = int(args.cache_max_mb * 1e6) if args.cache_max_mb else None
+            self.result_cache = ResultCache(args.cache_dir, max_bytes)
+        self.upload_registry = UploadRegistry(args.upload_registry, args.keep_uploads, args.upload_timeout)
+        self.media_cache = None
+        if not args.no_media_cache:
+            max_bytes = int(args.media_cache_max_gb * 1e9) if args.media_cache_max_gb else None
+            self.media_cache = MediaCache(args.media_cache_dir, max_bytes)
+        self.hash_cache = HashCache(args.hash_cache)
+        self.hash_executor = ThreadPoolExecutor(max_workers=max(1, args.jobs), thread_name_prefix="hash")
+        self.job_store = JobStore(args.job_db)
+        self.report_index = None if args.no_report_index else ReportIndex(args.report_index)
+        self.scratch_dir = make_scratch_dir("run-")
+
+    def close(self):
+        """Releases run-level resources: deferred upload deletions and this run's scratch directory."""
+        self.upload_registry.close()
+        self.hash_executor.shutdown()
+        self.job_store.close()
+        if self.report_index:
+            self.report_index.close()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        try:
+            os.rmdir(TEMP_DIR) # Only succeeds once no other run is using it
+        except OSError:
+            pass
+        logging.info("Cleaned up temporary directory.")
+
+def analysis_parameters(args):
+    """
+    Returns everything besides the video itself that determines an analysis
+    result, including a fingerprint of the prompts. Used to key the result cache.
+    """
+    if args.analysis_mode == 'video' and args.segment:
+        prompts = [build_segment_prompt(args.focus, args.language, 0, 0), build_reduce_prompt([], args.focus, args.language, "video with audio")]
+    elif args.analysis_mode == 'frames' and args.window:
+        prompts = [build_window_prompt(args.focus, args.language, 0, 0), build_reduce_prompt([], args.focus, args.language)]
+    elif args.analysis_mode == 'frames':
+        prompts = [build_frames_prompt(args.focus, args.language)]
+    else:
+        prompts = [build_video_prompt(args.focus, args.language)]
+
+    parameters = {
+        "model": args.model,
+        "analysis_mode": args.analysis_mode,
+        "focus": args.focus,
+        "language": args.language,
+        "prompt_sha256": hashlib.sha256("\n".join(prompts).encode("utf-8")).hexdigest(),
+        "start": args.start,
+        "end": args.end,
+    }
+    if args.analysis_mode == 'frames':
+        parameters.update({
+            "interval": args.interval,
+            "frame_backend": args.frame_backend,
+            "window": args.window,
+            "dedup": args.dedup,
+            "scene_threshold": args.scene_threshold if args.dedup is not None else None,
+            "max_request_mb": args.max_request_mb,
+            "max_request_tokens": args.max_request_tokens,
+        })
+    else:
+        parameters["segment"] = args.segment
+    return parameters
+
+def _file_size(path):
+    """Returns the size of a file in bytes, or None if it does not exist."""
+    try:
+        return os.path.getsize(path) if path else None
+    except OSError:
+        return None
+
+def _is_scratch_path(path):
+    """True for files in the temporary directory, which will not exist again in a later run."""
+    return os.path.abspath(path).startswith(os.path.abspath(TEMP_DIR) + os.sep)
+
+def hash_video(video_path, hash_cache):
+    """
+    get_video_hash, recorded as a 'hash' metrics span. Scratch files (trimmed
+    clips, downloads before they enter the media cache) are not recorded in
+    the hash cache.
+    """
+    with metrics.span("hash", bytes=_file_size(video_path)):
+        return get_video_hash(video_path, None if _is_scratch_path(video_path) else hash_cache)
+
+def acquire_video(video_input, args, context, scratch_dirs):
+    """
+    Resolves an input to a local MP4 file. YouTube videos are served from the
+    media cache when present; otherwise they are downloaded and converted in a
+    scratch directory (appended to `scratch_dirs` for the caller to remove once
+    the input is done) and added to the cache. Returns (processed_video_path,
+    original_filename, video_hash), with a None path on failure and a None hash
+    if it is not known yet.
+    """
+    processed_video_path = None
+    original_filename = ""
+    video_hash = None
+    limits = context.limits
+
+    if os.path.exists(video_input):
+        logging.info("Input is a local file.")
+        processed_video_path = video_input
+        original_filename = os.path.basename(video_input)
+    elif is_youtube_url(video_input):
+        video_id = youtube_video_id(video_input)
+        cached = context.media_cache.get(video_id) if context.media_cache else None
+        if cached:
+            processed_video_path, meta = cached
+            original_filename, video_hash = meta["original_filename"], meta["sha256"]
+            logging.info(f"Input is a YouTube URL. Using cached video {video_id} from {processed_video_path}.")
+            return processed_video_path, original_filename, video_hash
+
+        logging.info("Input is a YouTube URL. Starting download...")
+        scratch_dir = make_scratch_dir("download-", context.scratch_dir)
+        scratch_dirs.append(scratch_dir)
+        with limits["download"], metrics.span("download") as span:
+            downloaded_path = download_youtube_video(video_input, scratch_dir)
+            span["bytes"] = _file_size(downloaded_path)
+        if downloaded_path:
+            original_filename = os.path.basename(downloaded_path)
+            with limits["convert"], metrics.span("convert") as span:
+                processed_video_path = convert_to_mp4(downloaded_path, args.ffmpeg_preset, args.ffmpeg_threads)
+                span["bytes"] = _file_size(processed_video_path)
+        if processed_video_path and context.media_cache:
+            video_hash = hash_video(processed_video_path, context.hash_cache)
+            if video_hash:
+                processed_video_path = context.media_cache.put(video_id, processed_video_path, original_filename, video_hash)
+    else:
+        logging.error(f"Input '{video_input}' is not a valid file path or YouTube URL. Skipping.")
+
+    return processed_video_path, original_filename, video_hash
+
+def extract_frames_for_analysis(processed_video_path, args, run_metadata):
+    """
+    Starts 'frames' mode extraction with the run's sampling, dedup and encoding
+    options, recording them in run_metadata. Returns the frame stream, or None.
+    """
+    interval, max_side, jpeg_quality = args.interval, None, DEFAULT_JPEG_QUALITY
+    encoding_plan = None
+    if args.max_request_mb or args.max_request_tokens:
+        max_bytes = int(args.max_request_mb * 1e6) if args.max_request_mb else None
+        encoding_plan = plan_frame_encoding(
+            processed_video_path, args.interval, max_bytes, args.max_request_tokens, args.window, args.start, args.end
+        )
+        if encoding_plan:
+            interval, max_side, jpeg_quality = encoding_plan["interval"], encoding_plan["max_side"], encoding_plan["jpeg_quality"]
+
+    frame_stats = {}
+    frames = iter_frames(
+        processed_video_path, interval, args.sampler,
+        dedup_threshold=args.dedup, scene_threshold=args.scene_threshold, stats=frame_stats,
+        max_side=max_side, jpeg_quality=jpeg_quality, start_sec=args.start, end_sec=args.end,
+        workers=args.extract_workers, backend=args.frame_backend
+    )
+    run_metadata["frames"] = {
+        "interval": interval,
+        "backend": args.frame_backend,
+        "window": args.window,
+        "dedup_threshold": args.dedup,
+        "max_side": max_side,
+        "jpeg_quality": jpeg_quality,
+        "encoding_plan": encoding_plan,
+        "stats": frame_stats,
+    }
+    if frames is None:
+        logging.warning(f"Frame extraction failed for {run_metadata['video_filename']}. Skipping.")
+        return None
+    return prefetch(frames, args.max_in_flight)
+
+def start_frame_extraction(processed_video_path, args, run_metadata):
+    """
+    Starts 'frames' mode extraction ahead of its consumer: the first frame is
+    taken so that the prefetch thread keeps extracting (up to --max-in-flight
+    frames) while the caller does other work. Returns (frames, stream), where
+    frames yields every frame and closing stream stops extraction early, or
+    (None, None) if extraction failed.
+    """
+    stream = extract_frames_for_analysis(processed_video_path, args, run_metadata)
+    if stream is None:
+        return None, None
+    first = next(stream, None)
+    return itertools.chain([first] if first is not None else [], stream), stream
+
+def analyze_frames(frames, args, focus, language, stream_writer=None):
+    """Runs 'frames' mode analysis for one variant, in a single request or in windows."""
+    if args.window:
+        return analyze_frames_windowed(frames, args.model, focus, language, args.window, args.window_workers)
+    return analyze_frames_with_gemini(frames, args.model, focus, language, stream_writer)
+
+def analysis_variants(args):
+    """Returns the (focus, language) combinations requested with repeated --focus/--language flags."""
+    return [(focus, language) for focus in (args.focus or [None]) for language in (args.language or [None])]
+
+def variant_args(args, focus, language):
+    """Returns a copy of the arguments with a single focus and language."""
+    return argparse.Namespace(**{**vars(args), "focus": focus, "language": language})
+
+def supports_streaming(args, variants):
+    """--stream applies when a single request produces the whole report: one variant, without --window or --segment."""
+    if not args.stream or len(variants) != 1:
+        return False
+    return not (args.window if args.analysis_mode == 'frames' else args.segment)
+
+def run_analyses(processed_video_path, video_hash, args, variants, run_metadata, context, stream_writer=None, frames=None):
+    """
+    Analyzes one video for every (focus, language) variant, extracting frames
+    or uploading the video only once. In 'video' mode, --start/--end first cut
+    the time range out with stream copy, and --segment splits it into
+    separately analyzed segments. A StreamingReportWriter is used when the
+    single variant is analyzed in one request. In 'frames' mode, `frames`
+    already being extracted (see start_frame_extraction) are used if given.
+    Returns a list of (markdown, json) tuples in the order of `variants`.
+    """
+    if args.analysis_mode == 'frames':
+        if frames is None:
+            frames = extract_frames_for_analysis(processed_video_path, args, run_metadata)
+        if frames is None:
+            return [(None, None)] * len(variants)
+        if len(variants) == 1:
+            return [analyze_frames(frames, args, *variants[0], stream_writer)]
+        frames = list(frames)
+        if not args.window:
+            return analyze_frames_variants(frames, args.model, variants, args.variant_workers)
+        with ThreadPoolExecutor(max_workers=max(1, min(args.variant_workers, len(variants)))) as executor:
+            return list(executor.map(metrics.propagate(lambda variant: analyze_frames(frames, args, *variant)), variants))
+
+    scratch_dirs = []
+    try:
+        if args.start is not None or args.end is not None:
+            scratch_dirs.append(make_scratch_dir("trim-", context.scratch_dir))
+            with metrics.span("trim"):
+                processed_video_path = trim_video(processed_video_path, args.start, args.end, scratch_dirs[-1])
+            if not processed_video_path:
+                return [(None, None)] * len(variants)
+            video_hash = hash_video(processed_video_path, context.hash_cache)
+            run_metadata["time_range"] = {"start": args.start, "end": args.end}
+
+        if args.segment:
+            scratch_dirs.append(make_scratch_dir("segments-", context.scratch_dir))
+            with metrics.span("split"):
+                segments = split_video_segments(processed_video_path, args.segment, scratch_dirs[-1])
+            if not segments:
+                return [(None, None)] * len(variants)
+            offset = args.start or 0
+            segments = [(path, start + offset, end + offset) for path, start, end in segments]
+            run_metadata["segments"] = [{"start": start, "end": end} for _, start, end in segments]
+            return analyze_video_segmented(segments, args.model, variants, args.segment_workers, args.upload_timeout)
+
+        if len(variants) == 1:
+            focus, language = variants[0]
+            return [analyze_video_with_gemini(
+                processed_video_path, args.model, focus, language,
+                video_hash=video_hash, registry=context.upload_registry, stream_writer=stream_writer
+            )]
+        return analyze_video_variants(
+            processed_video_path, args.model, variants, video_hash, context.upload_registry, args.variant_workers
+        )
+    finally:
+        for scratch_dir in scratch_dirs:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def process_video_input(video_input, args, context, job=None):
+    """
+    Takes one input through acquisition, hashing, analysis and report writing.
+    Every (focus, language) variant gets its own report directory, but the
+    video is acquired, hashed, and extracted or uploaded only once. Returns
+    the list of report directories, empty if the input was skipped. If a Job
+    is given, each stage is recorded on it as it starts.
+
+    A download that did not end up in the media cache is removed when the
+    input is done, so a long-lived service does not accumulate them.
+    """
+    scratch_dirs = []
+    try:
+        return _process_video_input(video_input, args, context, job, scratch_dirs)
+    finally:
+        for scratch_dir in scratch_dirs:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def _process_video_input(video_input, args, context, job, scratch_dirs):
+    logging.info(f"--- Processing input: {video_input} ---")
+    limits = context.limits
+
+    if job:
+        job.begin("acquire")
+    processed_video_path, original_filename, video_hash = acquire_video(video_input, args, context, scratch_dirs)
+    if not processed_video_path:
+        logging.error(f"Failed to acquire or process video from '{video_input}'. Skipping.")
+        return []
+
+    if job:
+        job.begin("hash")
+    # Hashing runs in the background. It is only awaited up front when the
+    # result cache or the upload registry needs the hash before analysis. In
+    # 'frames' mode, extraction is started first so that it overlaps with
+    # hashing; if every variant then turns out to be cached, the frames
+    # extracted ahead (at most --max-in-flight) are discarded.
+    shared_metadata = {}
+    frames, frame_stream, extraction_started = None, None, False
+    if video_hash:
+        hash_future = None
+    else:
+        hash_future = context.hash_executor.submit(metrics.propagate(hash_video), processed_video_path, context.hash_cache)
+        if context.result_cache or args.analysis_mode == 'video':
+            if args.analysis_mode == 'frames':
+                with limits["analyze"]:
+                    frames, frame_stream = start_frame_extraction(processed_video_path, args, shared_metadata)
+                    extraction_started = True
+                    video_hash = hash_future.result()
+            else:
+                video_hash = hash_future.result()
+            if not video_hash:
+                logging.warning(f"Could not hash video {original_filename}. Skipping.")
+                if frame_stream:
+                    frame_stream.close()
+                return []
+            hash_future = None
+    if video_hash:
+        logging.info(f"SHA256 Hash for {original_filename}: {video_hash}")
+
+    base_metadata = {
+        "video_filename": original_filename,
+        "video_input": video_input,
+        "sha256": video_hash,
+        "model": args.model,
+        "analysis_mode": args.analysis_mode,
+    }
+
+    if job:
+        job.begin("analyze")
+    results = {}
+    cache_keys = {}
+    for focus, language in analysis_variants(args):
+        run_metadata = {**base_metadata, "focus": focus, "language": language}
+        cached = None
+        if context.result_cache:
+            cache_keys[(focus, language)] = make_cache_key(video_hash, analysis_parameters(variant_args(args, focus, language)))
+            if not args.refresh:
+                cached = context.result_cache.get(cache_keys[(focus, language)])
+        if cached:
+            logging.info(f"Using cached analysis for {original_filename} (cache key {cache_keys[(focus, language)]}).")
+            run_metadata.update({k: v for k, v in cached.get("metadata", {}).items() if k not in run_metadata})
+            run_metadata["cache"] = {"key": cache_keys[(focus, language)], "hit": True}
+            results[(focus, language)] = (cached["markdown"], cached["json"], run_metadata)
+        else:
+            results[(focus, language)] = (None, None, run_metadata)
+
+    pending = [variant for variant, (analysis_md, _, _) in results.items() if analysis_md is None]
+    if frame_stream and not pending:
+        frame_stream.close()
+    stream_writers = {}
+    if pending and supports_streaming(args, pending):
+        output_dir = create_output_directory("reports", original_filename, args.model, context.report_index)
+        if output_dir:
+            logging.info(f"Streaming report to: {output_dir}")
+            stream_writers[pending[0]] = StreamingReportWriter(output_dir, original_filename)
+    if pending:
+        if extraction_started and frames is None:
+            analyses = [(None, None)] * len(pending)
+        else:
+            with limits["analyze"]:
+                try:
+                    analyses = run_analyses(
+                        processed_video_path, video_hash, args, pending, shared_metadata, context, stream_writers.get(pending[0]), frames
+                    )
+                except BaseException as e:
+                    # E.g. an upload or ffmpeg error: the streamed report will never complete.
+                    for stream_writer in stream_writers.values():
+                        if stream_writer.status["state"] != "failed":
+                            stream_writer.fail(f"{type(e).__name__}: {e}")
+                        stream_writer.discard()
+                    raise
+        for variant, (analysis_md, analysis_json) in zip(pending, analyses):
+            run_metadata = {**results[variant][2], **shared_metadata}
+            if analysis_md and context.result_cache:
+                cached_metadata = {k: v for k, v in run_metadata.items() if k not in ("video_filename", "video_input")}
+                context.result_cache.put(cache_keys[variant], {"markdown": analysis_md, "json": analysis_json, "metadata": cached_metadata})
+                run_metadata["cache"] = {"key": cache_keys[variant], "hit": False}
+            results[variant] = (analysis_md, analysis_json, run_metadata)
+
+    if job:
+        job.begin("report")
+    if hash_future:
+        video_hash = hash_future.result()
+        if not video_hash:
+            logging.warning(f"Could not hash video {original_filename}. Skipping.")
+            return []
+        logging.info(f"SHA256 Hash for {original_filename}: {video_hash}")
+
+    output_dirs = []
+    for (focus, language), (analysis_md, analysis_json, run_metadata) in results.items():
+        run_metadata["sha256"] = video_hash
+        stream_writer = stream_writers.get((focus, language))
+        if not analysis_md:
+            logging.warning(f"Gemini analysis failed for {original_filename}. Skipping report generation.")
+            if stream_writer:
+                stream_writer.discard()
+            continue
+
+        with metrics.span("report"):
+            if stream_writer:
+                output_dir = stream_writer.output_dir
+                stream_writer.finish(analysis_md, analysis_json, run_metadata)
+            else:
+                output_dir = create_output_directory("reports", original_filename, args.model, context.report_index)
+                if not output_dir:
+                    logging.error(f"Could not create output directory for {original_filename}. Skipping report generation.")
+                    continue
+
+                logging.info(f"Saving reports to: {output_dir}")
+                save_reports(output_dir, analysis_md, analysis_json, original_filename, run_metadata)
+            if context.report_index:
+                parameters = analysis_parameters(variant_args(args, focus, language))
+                context.report_index.add_report(output_dir, run_metadata, analysis_json, parameters)
+            output_dirs.append(output_dir)
+    return output_dirs
+
+def item_args(args, overrides):
+    """Returns a copy of the arguments with one manifest item's option overrides applied."""
+    return argparse.Namespace(**{**vars(args), **overrides})
+
+def _run_job(video_input, overrides, args, context):
+    """
+    Runs one input as a recorded job and returns its outcome for the run
+    summary. With --resume, inputs whose job already completed with the same
+    analysis options are skipped. Unexpected errors fail only this input.
+    """
+    args = item_args(args, overrides)
+    job_key = make_cache_key(video_input, analysis_parameters(args))
+    if args.resume:
+        previous = context.job_store.get(job_key)
+        if previous and previous["status"] == "done":
+            logging.info(f"Skipping '{video_input}': completed in a previous run ({', '.join(previous['output_dirs'])}).")
+            return {"input": video_input, "status": "skipped", "stage": None, "error": None, "output_dirs": previous["output_dirs"]}
+
+    job = context.job_store.start(job_key, video_input, overrides)
+    with metrics.video_scope(video_input) as outcome:
+        try:
+            if args.profile and args.profile == video_input:
+                with metrics.profile(f"{metrics.profile_name(video_input)}-{job_key[:12]}", args.profile_dir, args.profile_memory):
+                    output_dirs = process_video_input(video_input, args, context, job)
+            else:
+                output_dirs = process_video_input(video_input, args, context, job)
+        except KeyboardInterrupt:
+            job.fail("Interrupted")
+            raise
+        except Exception as e:
+            logging.exception(f"Unexpected error while processing '{video_input}': {e}")
+            job.fail(f"{type(e).__name__}: {e}")
+        else:
+            expected = len(analysis_variants(args))
+            if len(output_dirs) == expected:
+                job.finish(output_dirs)
+            elif output_dirs:
+                job.fail(f"{expected - len(output_dirs)} of {expected} reports were not produced", output_dirs)
+            else:
+                job.fail("No report was produced")
+        outcome["status"] = job.status
+    return {"input": video_input, "status": job.status, "stage": job.stage, "error": job.error, "output_dirs": job.output_dirs}
+
+def run_pipeline(items, args):
+    """
+    Processes all inputs, running up to `args.jobs` videos concurrently with
+    per-stage limits from make_stage_limits and a shared result cache.
+
+    `items` is a list of (video_input, overrides) tuples, where overrides are
+    per-input option values (see load_manifest). Each input is recorded as a
+    job in the job store and the run ends with a summary. Returns a list of
+    (input, report directories) tuples in input order, with an empty list
+    for failed inputs.
+    """
+    context = PipelineContext(args)
+    started = time.monotonic()
+    try:
+        if args.jobs <= 1:
+            outcomes = [_run_job(video_input, overrides, args, context) for video_input, overrides in items]
+        else:
+            with ThreadPoolExecutor(max_workers=args.jobs, thread_name_prefix="video") as executor:
+                futures = [executor.submit(_run_job, video_input, overrides, args, context) for video_input, overrides in items]
+                outcomes = [future.result() for future in futures]
+    finally:
+        context.close()
+
+    if context.result_cache:
+        stats = context.result_cache.stats()
+        logging.info(
+            f"Result cache: {stats['hits']} hits, {stats['misses']} misses, {stats['writes']} writes, "
+            f"{stats['evictions']} evictions, {stats['entries']} entries ({stats['bytes'] / 1e6:.1f} MB)."
+        )
+    log_run_summary(outcomes, time.monotonic() - started)
+    return [(outcome["input"], outcome["output_dirs"] if outcome["status"] != "failed" else []) for outcome in outcomes]
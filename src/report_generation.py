@@ -1,37 +1,62 @@
 import os
+import time
 import datetime
 import json
 import markdown2
 import logging
+import sqlite3
+import shutil
 
-def create_output_directory(base_reports_dir, video_filename, model_name):
-    """Creates a unique, structured directory for the analysis run."""
+from src.cache import atomic_write
+
+def create_output_directory(base_reports_dir, video_filename, model_name, report_index=None):
+    """
+    Creates a unique, structured directory for the analysis run.
+
+    With a `report_index`, the run number is allocated from its counter
+    instead of probing for the first unused number.
+    """
     base_video_name = os.path.splitext(video_filename)[0]
     today_str = datetime.date.today().strftime("%Y%m%d")
     run_number = 1
     
     video_model_dir = os.path.join(base_reports_dir, base_video_name, model_name)
     
+    if report_index:
+        resync = False
+        while True:
+            try:
+                run_number = report_index.next_run_number(video_model_dir, today_str, resync)
+            except sqlite3.Error as e:
+                logging.warning(f"Could not allocate a run number from the report index ({e}); probing for a free one.")
+                break
+            output_dir = os.path.join(video_model_dir, f"{today_str}-{run_number:03d}")
+            try:
+                os.makedirs(output_dir)
+                return output_dir
+            except FileExistsError:
+                # Created outside the index; resynchronize the counter with the directory.
+                resync = True
+            except OSError as e:
+                logging.error(f"Failed to create output directory {output_dir}: {e}")
+                return None
+
     while True:
         output_dir = os.path.join(video_model_dir, f"{today_str}-{run_number:03d}")
         if not os.path.exists(output_dir):
             try:
                 os.makedirs(output_dir)
                 return output_dir
+            except FileExistsError:
+                # Another concurrent run claimed this number first; try the next one.
+                pass
             except OSError as e:
                 logging.error(f"Failed to create output directory {output_dir}: {e}")
                 return None
         run_number += 1
 
-def save_reports(output_dir, markdown_content, json_content, video_filename):
-    """Saves the markdown, html, and json reports to the specified directory."""
-    if not markdown_content:
-        logging.error("No markdown content provided to save.")
-        return
-
-    base_video_name = os.path.splitext(video_filename)[0]
-    
-    # Save Markdown
+def save_markdown(output_dir, markdown_content):
+    """Saves the Markdown report as analysis.md."""
     md_path = os.path.join(output_dir, "analysis.md")
     try:
         with open(md_path, "w") as f:
@@ -40,19 +65,33 @@ def save_reports(output_dir, markdown_content, json_content, video_filename):
     except IOError as e:
         logging.error(f"Failed to save Markdown report to {md_path}: {e}")
 
-    # Save JSON
-    if json_content:
-        json_path = os.path.join(output_dir, "analysis.json")
-        try:
-            with open(json_path, "w") as f:
-                json.dump(json_content, f, indent=4)
-            logging.info(f"JSON report saved to: {json_path}")
-        except IOError as e:
-            logging.error(f"Failed to save JSON report to {json_path}: {e}")
-        except TypeError as e:
-            logging.error(f"Failed to serialize JSON data: {e}")
-
-    # Save HTML
+def save_json(output_dir, json_content):
+    """Saves the parsed JSON findings as analysis.json."""
+    json_path = os.path.join(output_dir, "analysis.json")
+    try:
+        with open(json_path, "w") as f:
+            json.dump(json_content, f, indent=4)
+        logging.info(f"JSON report saved to: {json_path}")
+    except IOError as e:
+        logging.error(f"Failed to save JSON report to {json_path}: {e}")
+    except TypeError as e:
+        logging.error(f"Failed to serialize JSON data: {e}")
+
+def save_metadata(output_dir, metadata):
+    """Saves the run's parameters and provenance as metadata.json."""
+    metadata_path = os.path.join(output_dir, "metadata.json")
+    try:
+        with open(metadata_path, "w") as f:
+            json.dump(metadata, f, indent=4)
+        logging.info(f"Run metadata saved to: {metadata_path}")
+    except IOError as e:
+        logging.error(f"Failed to save run metadata to {metadata_path}: {e}")
+    except TypeError as e:
+        logging.error(f"Failed to serialize run metadata: {e}")
+
+def save_html(output_dir, markdown_content, video_filename):
+    """Renders the Markdown report to a styled, self-contained analysis.html."""
+    base_video_name = os.path.splitext(video_filename)[0]
     html_path = os.path.join(output_dir, "analysis.html")
     try:
         html_content = markdown2.markdown(markdown_content, extras=["tables", "fenced-code-blocks", "styling"])
@@ -81,3 +120,112 @@ def save_reports(output_dir, markdown_content, json_content, video_filename):
         logging.error(f"Failed to save HTML report to {html_path}: {e}")
     except Exception as e:
         logging.error(f"An unexpected error occurred during HTML generation: {e}")
+
+def save_reports(output_dir, markdown_content, json_content, video_filename, metadata=None):
+    """
+    Saves the markdown, html, and json reports to the specified directory.
+    If `metadata` is given, the run's parameters and provenance are saved
+    alongside them in metadata.json.
+    """
+    if not markdown_content:
+        logging.error("No markdown content provided to save.")
+        return
+
+    save_markdown(output_dir, markdown_content)
+    if json_content:
+        save_json(output_dir, json_content)
+    if metadata:
+        save_metadata(output_dir, metadata)
+    save_html(output_dir, markdown_content, video_filename)
+
+class StreamingReportWriter:
+    """
+    Writes a report while the model's response streams in.
+
+    Text chunks are appended to analysis.md and flushed as they arrive, so
+    the file can be tailed. analysis.json is written as soon as the caller
+    has parsed the JSON block, and analysis.html and metadata.json when the
+    response is complete. Progress is kept in status.json (state, time to
+    first token, chunks and characters received), which is replaced
+    atomically on every update so a wrapper can poll it.
+    """
+
+    def __init__(self, output_dir, video_filename):
+        self.output_dir = output_dir
+        self.video_filename = video_filename
+        self.md_path = os.path.join(output_dir, "analysis.md")
+        self.status_path = os.path.join(output_dir, "status.json")
+        self.md_file = None
+        self.started = None
+        self.status = {
+            "state": "waiting",
+            "started_at": None,
+            "time_to_first_token_sec": None,
+            "chunks": 0,
+            "characters": 0,
+            "json_written": False,
+            "error": None,
+        }
+        self._write_status()
+
+    def start(self):
+        """Marks the moment the request is sent; time to first token is measured from here."""
+        self.started = time.monotonic()
+        self.status["started_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.md_file = open(self.md_path, "w")
+        self._write_status()
+
+    def write(self, text):
+        """Appends one chunk of the response to analysis.md."""
+        if self.status["chunks"] == 0:
+            ttft = time.monotonic() - self.started
+            self.status["state"] = "streaming"
+            self.status["time_to_first_token_sec"] = round(ttft, 3)
+            logging.info(f"First tokens received after {ttft:.1f}s; streaming to {self.md_path}")
+        self.md_file.write(text)
+        self.md_file.flush()
+        self.status["chunks"] += 1
+        self.status["characters"] += len(text)
+        self._write_status()
+
+    def write_json(self, json_content):
+        """Saves analysis.json as soon as the report's JSON block is complete."""
+        save_json(self.output_dir, json_content)
+        self.status["json_written"] = True
+        self._write_status()
+
+    def finish(self, markdown_content, json_content=None, metadata=None):
+        """Completes the report: JSON (if not yet written), metadata and HTML."""
+        self._close()
+        if json_content and not self.status["json_written"]:
+            self.write_json(json_content)
+        if metadata:
+            save_metadata(self.output_dir, metadata)
+        save_html(self.output_dir, markdown_content, self.video_filename)
+        self.status["state"] = "complete"
+        self._write_status()
+
+    def fail(self, error):
+        """Marks the report as failed, leaving whatever was received in analysis.md."""
+        self._close()
+        self.status["state"] = "failed"
+        self.status["error"] = error
+        self._write_status()
+
+    def discard(self):
+        """Removes the report directory of a failed stream, including the partial analysis.md."""
+        self._close()
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+        logging.info(f"Removed incomplete streamed report {self.output_dir}")
+
+    def _close(self):
+        if self.md_file:
+            self.md_file.close()
+            self.md_file = None
+
+    def _write_status(self):
+        self.status["updated_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        try:
+            atomic_write(self.status_path, json.dumps(self.status, indent=4).encode("utf-8"))
+        except OSError as e:
+            logging.warning(f"Failed to update stream status {self.status_path}: {e}")
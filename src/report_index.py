@@ -0,0 +1,300 @@
+import os
+import csv
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import logging
+import threading
+
+# Default location of the index, next to the reports it describes.
+DEFAULT_INDEX_PATH = os.path.join("reports", "index.sqlite")
+
+# Fields of the 'reports' table that can be filtered on and grouped by from the command line.
+GROUP_FIELDS = ["sentiment", "emotional_state", "confidence", "model", "video_name", "analysis_mode", "language", "focus", "run_date"]
+
+# Columns printed by `list` in table format.
+TABLE_COLUMNS = ["output_dir", "model", "sentiment", "confidence", "emotional_state", "observation_count"]
+
+def _run_date_and_number(output_dir):
+    """Splits a run directory name such as '20250101-003' into ('20250101', 3), or (None, None)."""
+    run_date, _, run_number = os.path.basename(os.path.normpath(output_dir)).partition("-")
+    return (run_date, int(run_number)) if run_number.isdigit() else (None, None)
+
+def _highest_existing_run(video_model_dir, run_date):
+    """Returns the highest run number among a directory's '<run_date>-NNN' subdirectories, or 0."""
+    try:
+        names = os.listdir(video_model_dir)
+    except FileNotFoundError:
+        return 0
+    numbers = [_run_date_and_number(name) for name in names]
+    return max([number for date, number in numbers if date == run_date], default=0)
+
+def report_fields(json_content):
+    """Extracts the indexed fields (sentiment, confidence, emotional state, observations) from an analysis.json."""
+    if not isinstance(json_content, dict):
+        return {"emotional_state": None, "sentiment": None, "sentiment_justification": None, "confidence": None, "observations": []}
+    sentiment = json_content.get("sentiment")
+    justification = None
+    if isinstance(sentiment, dict):
+        sentiment, justification = sentiment.get("classification"), sentiment.get("justification")
+    observations = []
+    for observation in json_content.get("key_observations") or []:
+        if isinstance(observation, dict):
+            observations.append((observation.get("type"), observation.get("detail")))
+        else:
+            observations.append((None, str(observation)))
+    text = lambda value: str(value).strip() if value is not None else None
+    return {
+        "emotional_state": text(json_content.get("emotional_state")),
+        "sentiment": text(sentiment).capitalize() if sentiment else None,
+        "sentiment_justification": text(justification),
+        "confidence": text(json_content.get("confidence_level")),
+        "observations": observations,
+    }
+
+class ReportIndex:
+    """
+    A SQLite index of the reports tree, updated as each report is saved.
+
+    The 'reports' table has one row per report directory with the video's
+    hash, model, analysis parameters and the sentiment, confidence and
+    emotional state of its analysis.json; 'observations' holds its key
+    observations. 'run_counters' holds the last run number allocated per
+    video/model directory and date, so that a new run directory is found
+    without probing the existing ones. Like the JobStore, the index can be
+    shared by the threads of a run and by concurrent runs.
+    """
+
+    def __init__(self, db_path=DEFAULT_INDEX_PATH):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS reports ("
+                "output_dir TEXT PRIMARY KEY, video_name TEXT, video_filename TEXT, video_input TEXT, sha256 TEXT, "
+                "model TEXT, analysis_mode TEXT, focus TEXT, language TEXT, run_date TEXT, run_number INTEGER, "
+                "parameters TEXT, emotional_state TEXT, sentiment TEXT, sentiment_justification TEXT, confidence TEXT, "
+                "observation_count INTEGER NOT NULL DEFAULT 0, cache_hit INTEGER, indexed_at REAL NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS observations ("
+                "output_dir TEXT NOT NULL, position INTEGER NOT NULL, type TEXT, detail TEXT, "
+                "PRIMARY KEY (output_dir, position))"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS run_counters ("
+                "directory TEXT NOT NULL, run_date TEXT NOT NULL, last_number INTEGER NOT NULL, "
+                "PRIMARY KEY (directory, run_date))"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS reports_model_sentiment ON reports (model, sentiment)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS reports_sha256 ON reports (sha256)")
+
+    def next_run_number(self, video_model_dir, run_date, resync=False):
+        """
+        Allocates the next run number for `video_model_dir` on `run_date`.
+
+        The counter is seeded from the directory's existing runs the first time
+        a directory and date are seen, or when `resync` is set (after a run
+        directory turned out to exist already, e.g. one created without the
+        index); otherwise allocation is a single counter increment.
+        """
+        directory = os.path.abspath(video_model_dir)
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute(
+                    "SELECT last_number FROM run_counters WHERE directory = ? AND run_date = ?", (directory, run_date)
+                ).fetchone()
+                last_number = row[0] if row else 0
+                if row is None or resync:
+                    last_number = max(last_number, _highest_existing_run(directory, run_date))
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO run_counters (directory, run_date, last_number) VALUES (?, ?, ?)",
+                    (directory, run_date, last_number + 1),
+                )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return last_number + 1
+
+    def add_report(self, output_dir, metadata, json_content, parameters=None):
+        """
+        Indexes (or re-indexes) one saved report from its run metadata,
+        analysis.json content and analysis parameters. Failures are logged and
+        do not affect the saved report.
+        """
+        metadata = metadata or {}
+        fields = report_fields(json_content)
+        run_date, run_number = _run_date_and_number(output_dir)
+        model_dir = os.path.dirname(os.path.normpath(output_dir))
+        cache = metadata.get("cache")
+        join = lambda value: ", ".join(value) if isinstance(value, list) else value
+        row = (
+            os.path.normpath(output_dir), os.path.basename(os.path.dirname(model_dir)), metadata.get("video_filename"),
+            metadata.get("video_input"), metadata.get("sha256"), metadata.get("model") or os.path.basename(model_dir),
+            metadata.get("analysis_mode"), join(metadata.get("focus")), join(metadata.get("language")), run_date, run_number,
+            json.dumps(parameters, sort_keys=True) if parameters is not None else None,
+            fields["emotional_state"], fields["sentiment"], fields["sentiment_justification"], fields["confidence"],
+            len(fields["observations"]), int(cache["hit"]) if isinstance(cache, dict) else None, time.time(),
+        )
+        try:
+            with self.lock:
+                self.connection.execute("BEGIN IMMEDIATE")
+                try:
+                    self.connection.execute(f"INSERT OR REPLACE INTO reports VALUES ({', '.join('?' * len(row))})", row)
+                    self.connection.execute("DELETE FROM observations WHERE output_dir = ?", (row[0],))
+                    self.connection.executemany(
+                        "INSERT INTO observations (output_dir, position, type, detail) VALUES (?, ?, ?, ?)",
+                        [(row[0], position, kind, detail) for position, (kind, detail) in enumerate(fields["observations"])],
+                    )
+                    self.connection.execute("COMMIT")
+                except BaseException:
+                    self.connection.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            logging.warning(f"Failed to add {output_dir} to the report index {self.db_path}: {e}")
+
+    def _where(self, filters):
+        clauses, values = [], []
+        for field, value in (filters or {}).items():
+            if value is None:
+                continue
+            if field == "since":
+                clauses.append("run_date >= ?")
+            else:
+                clauses.append(f"{field} = ? COLLATE NOCASE")
+            values.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), values
+
+    def query(self, filters=None, limit=None, observations=False):
+        """
+        Returns indexed reports matching `filters` (a dict of column values;
+        'since' is a minimum run date), newest first, as dicts. With
+        `observations`, each dict also has its list of key observations.
+        """
+        where, values = self._where(filters)
+        sql = f"SELECT * FROM reports{where} ORDER BY run_date DESC, indexed_at DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self.lock:
+            cursor = self.connection.execute(sql, values)
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            if observations:
+                for row in rows:
+                    row["observations"] = [
+                        {"type": kind, "detail": detail} for kind, detail in self.connection.execute(
+                            "SELECT type, detail FROM observations WHERE output_dir = ? ORDER BY position", (row["output_dir"],)
+                        )
+                    ]
+        for row in rows:
+            row["parameters"] = json.loads(row["parameters"]) if row["parameters"] else None
+        return rows
+
+    def count_by(self, field, filters=None):
+        """Returns (value, count) pairs of `field` (one of GROUP_FIELDS) over the reports matching `filters`, most common first."""
+        if field not in GROUP_FIELDS:
+            raise ValueError(f"Cannot group by '{field}' (allowed: {', '.join(GROUP_FIELDS)})")
+        where, values = self._where(filters)
+        with self.lock:
+            return self.connection.execute(
+                f"SELECT {field}, COUNT(*) AS n FROM reports{where} GROUP BY {field} ORDER BY n DESC, {field}", values
+            ).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def rebuild_index(index, reports_dir="reports"):
+    """
+    Indexes every report directory (one containing analysis.md) under
+    `reports_dir`, e.g. for reports saved before the index existed. Streamed
+    reports whose status.json does not say 'complete' are skipped. Reports
+    already in the index are refreshed. Returns the number of reports indexed.
+    """
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(reports_dir):
+        dirnames.sort()
+        if "analysis.md" not in filenames:
+            continue
+        if "status.json" in filenames and (_read_json(os.path.join(dirpath, "status.json")) or {}).get("state") != "complete":
+            continue
+        metadata = _read_json(os.path.join(dirpath, "metadata.json"))
+        index.add_report(dirpath, metadata, _read_json(os.path.join(dirpath, "analysis.json")))
+        count += 1
+    return count
+
+def _print_rows(rows, columns, output_format):
+    if output_format == "jsonl":
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False, default=str))
+    elif output_format == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v for k, v in row.items()})
+    else:
+        widths = {c: max([len(c)] + [len(str(row.get(c) if row.get(c) is not None else "")) for row in rows]) for c in columns}
+        print("  ".join(c.ljust(widths[c]) for c in columns))
+        for row in rows:
+            print("  ".join(str(row.get(c) if row.get(c) is not None else "").ljust(widths[c]) for c in columns))
+
+def main(argv=None):
+    """Command-line interface: rebuild, list (query and export) and stats over the report index."""
+    parser = argparse.ArgumentParser(prog="python -m src.report_index", description="Query and export the index of analysis reports.")
+    parser.add_argument("--db", type=str, default=DEFAULT_INDEX_PATH, help=f"Report index database (default: {DEFAULT_INDEX_PATH}).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild", help="Index all reports found under a reports directory.")
+    rebuild.add_argument("--reports-dir", type=str, default="reports")
+
+    list_parser = commands.add_parser("list", help="List (or export) indexed reports.")
+    stats = commands.add_parser("stats", help="Count indexed reports grouped by a field, e.g. the sentiment distribution for a model.")
+    stats.add_argument("--by", choices=GROUP_FIELDS, default="sentiment", help="Field to group by (default: sentiment).")
+    for command in (list_parser, stats):
+        command.add_argument("--model", type=str, default=None)
+        command.add_argument("--video", dest="video_name", type=str, default=None, help="Video name (the report directory name).")
+        command.add_argument("--sha256", type=str, default=None)
+        command.add_argument("--sentiment", type=str, default=None)
+        command.add_argument("--confidence", type=str, default=None)
+        command.add_argument("--analysis-mode", type=str, default=None)
+        command.add_argument("--language", type=str, default=None)
+        command.add_argument("--since", type=str, default=None, metavar="YYYYMMDD", help="Only reports from runs on or after this date.")
+        command.add_argument("--format", choices=["table", "csv", "jsonl"], default="table")
+    list_parser.add_argument("--limit", type=int, default=None)
+    list_parser.add_argument("--observations", action="store_true", help="Include key observations (jsonl format).")
+    args = parser.parse_args(argv)
+
+    index = ReportIndex(args.db)
+    try:
+        if args.command == "rebuild":
+            print(f"Indexed {rebuild_index(index, args.reports_dir)} reports from {args.reports_dir} into {args.db}.")
+            return
+        filters = {k: getattr(args, k) for k in ("model", "video_name", "sha256", "sentiment", "confidence", "analysis_mode", "language", "since")}
+        if args.command == "list":
+            rows = index.query(filters, args.limit, args.observations)
+            columns = TABLE_COLUMNS if args.format == "table" else list(rows[0]) if rows else TABLE_COLUMNS
+            _print_rows(rows, columns, args.format)
+        else:
+            counts = index.count_by(args.by, filters)
+            total = sum(n for _, n in counts)
+            rows = [{args.by: value, "count": n, "share": f"{n / total:.1%}"} for value, n in counts]
+            _print_rows(rows, [args.by, "count", "share"], args.format)
+    finally:
+        index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+import os
+import json
+import time
+import queue
+import socket
+import logging
+import threading
+import itertools
+import socketserver
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.cache import make_cache_key
+from src.jobs import parse_manifest_item
+from src.video_processing import check_time_range
+from src.pipeline import PipelineContext, analysis_parameters, item_args, _run_job
+
+# Finished jobs kept in memory for status and result requests; older ones are
+# forgotten (their state remains in the job store and the report index).
+MAX_FINISHED_JOBS = 1000
+
+# Largest request body accepted by the API, in bytes.
+MAX_REQUEST_BYTES = 1024 * 1024
+
+class ServiceJob:
+    """One submitted input and its progress through the service's queue."""
+
+    def __init__(self, job_id, video_input, overrides, job_key):
+        self.id = job_id
+        self.video_input = video_input
+        self.overrides = overrides
+        self.job_key = job_key
+        self.status = "queued"
+        self.stage = None
+        self.error = None
+        self.output_dirs = []
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "id": self.id, "input": self.video_input, "options": self.overrides, "status": self.status,
+            "stage": self.stage, "error": self.error, "output_dirs": self.output_dirs,
+            "submitted_at": self.submitted_at, "started_at": self.started_at, "finished_at": self.finished_at,
+        }
+
+class AnalysisService:
+    """
+    Runs submitted inputs on a pool of long-lived worker threads that share
+    one PipelineContext, so the Gemini client, caches, job store and report
+    index stay warm between jobs.
+
+    Each job goes through the same per-input pipeline as a command-line run
+    (`process`, by default the pipeline's _run_job). A different `process`
+    with the same signature, (video_input, overrides, args, context) ->
+    outcome dict, can be injected, e.g. to exercise the service without
+    calling Gemini.
+    """
+
+    def __init__(self, args, process=None):
+        self.args = args
+        self.process = process or _run_job
+        self.context = PipelineContext(args)
+        self.queue = queue.Queue()
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.session = time.strftime("%Y%m%d%H%M%S")
+        self.workers = [
+            threading.Thread(target=self._work, name=f"service-worker-{i + 1}", daemon=True)
+            for i in range(max(1, args.jobs))
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, raw_items):
+        """
+        Queues one or more inputs, each given as a dict with an 'input' and
+        optional option overrides, as in a manifest. All items are validated
+        before any is queued; raises ValueError on a malformed item. Returns
+        the new jobs.
+        """
+        if isinstance(raw_items, (dict, str)):
+            raw_items = [raw_items]
+        if not isinstance(raw_items, list) or not raw_items:
+            raise ValueError("expected a job object or a non-empty list of job objects")
+        items = []
+        for position, raw in enumerate(raw_items):
+            if isinstance(raw, str):
+                raw = {"input": raw}
+            if not isinstance(raw, dict):
+                raise ValueError(f"item {position}: expected a JSON object")
+            video_input, overrides = parse_manifest_item(raw, f"item {position}")
+            try:
+                check_time_range(overrides.get("start", self.args.start), overrides.get("end", self.args.end))
+            except ValueError as e:
+                raise ValueError(f"item {position}: {e}") from None
+            items.append((video_input, overrides))
+        return self.enqueue(items)
+
+    def enqueue(self, items):
+        """Queues already validated (video_input, overrides) tuples and returns their jobs."""
+        jobs = []
+        with self.lock:
+            for video_input, overrides in items:
+                job_key = make_cache_key(video_input, analysis_parameters(item_args(self.args, overrides)))
+                job = ServiceJob(f"{self.session}-{next(self.ids)}", video_input, overrides, job_key)
+                self.jobs[job.id] = job
+                jobs.append(job)
+        for job in jobs:
+            logging.info(f"Queued job {job.id}: {job.video_input}")
+            self.queue.put(job)
+        return jobs
+
+    def get(self, job_id):
+        """Returns a job's status as a dict, including its current pipeline stage while it runs, or None."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            status = job.to_dict()
+        if status["status"] == "running":
+            record = self.context.job_store.get(job.job_key)
+            status["stage"] = record["stage"] if record else None
+        return status
+
+    def list(self):
+        """Returns the status of all jobs still held in memory, oldest first."""
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def result(self, job_id):
+        """
+        Returns (status, reports) for a job. Once the job has finished,
+        reports lists each report directory with its analysis.md text and
+        parsed analysis.json and metadata.json; before that it is None.
+        """
+        status = self.get(job_id)
+        if status is None or status["status"] in ("queued", "running"):
+            return status, None
+        reports = []
+        for output_dir in status["output_dirs"]:
+            report = {"output_dir": output_dir}
+            for key, filename in (("markdown", "analysis.md"), ("analysis", "analysis.json"), ("metadata", "metadata.json")):
+                try:
+                    with open(os.path.join(output_dir, filename)) as f:
+                        report[key] = f.read() if key == "markdown" else json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    report[key] = None
+            reports.append(report)
+        return status, reports
+
+    def counts(self):
+        """Returns the number of jobs in each status."""
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            with self.lock:
+                if job.status != "queued":
+                    continue
+                job.status, job.started_at = "running", time.time()
+            logging.info(f"Starting job {job.id}: {job.video_input}")
+            try:
+                outcome = self.process(job.video_input, job.overrides, self.args, self.context)
+            except Exception as e:
+                logging.exception(f"Job {job.id} failed: {e}")
+                outcome = {"status": "failed", "stage": None, "error": f"{type(e).__name__}: {e}", "output_dirs": []}
+            with self.lock:
+                job.status, job.stage, job.error = outcome["status"], outcome["stage"], outcome["error"]
+                job.output_dirs, job.finished_at = outcome["output_dirs"], time.time()
+                self._forget_old_jobs()
+            logging.info(f"Job {job.id} {job.status} in {job.finished_at - job.started_at:.1f}s: {job.video_input}")
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def close(self):
+        """Cancels queued jobs, waits for running ones to finish and releases the pipeline context."""
+        with self.lock:
+            for job in self.jobs.values():
+                if job.status == "queued":
+                    job.status, job.error, job.finished_at = "cancelled", "Service stopped", time.time()
+            running = sum(1 for job in self.jobs.values() if job.status == "running")
+        if running:
+            logging.info(f"Waiting for {running} running jobs to finish...")
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.context.close()
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of the service:
+
+        POST /jobs                 submit a job object or a list of them; 202 with the new jobs
+        GET  /jobs                 status of all jobs
+        GET  /jobs/<id>            status of one job, including its current stage
+        GET  /jobs/<id>/result     reports of a finished job (409 while it is queued or running)
+        GET  /health               worker count and number of jobs per status
+    """
+    server_version = "VideoAnalyzer"
+    # Seconds a client may take to send its request, so that a short body cannot hold a thread forever.
+    timeout = 30
+
+    def do_GET(self):
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        service = self.server.service
+        if parts == ["health"]:
+            self._send(200, {"status": "ok", "workers": len(service.workers), "jobs": service.counts()})
+        elif parts == ["jobs"]:
+            self._send(200, {"jobs": service.list()})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            status = service.get(parts[1])
+            self._send(200, status) if status else self._send(404, {"error": f"Unknown job '{parts[1]}'"})
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+            status, reports = service.result(parts[1])
+            if status is None:
+                self._send(404, {"error": f"Unknown job '{parts[1]}'"})
+            elif reports is None:
+                self._send(409, {"error": f"Job is {status['status']}", "job": status})
+            else:
+                self._send(200, {"job": status, "reports": reports})
+        else:
+            self._send(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if [part for part in self.path.split("?")[0].split("/") if part] != ["jobs"]:
+            self._send(404, {"error": "Not found"})
+            return
+        header = self.headers.get("Content-Length")
+        if header is None:
+            self.close_connection = True
+            self._send(411, {"error": "Content-Length required"})
+            return
+        try:
+            length = int(header)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._send(400, {"error": f"Invalid Content-Length: {header!r}"})
+            return
+        if length > MAX_REQUEST_BYTES:
+            self.close_connection = True
+            self._send(413, {"error": "Request body too large"})
+            return
+        try:
+            body = self.rfile.read(length)
+        except TimeoutError:
+            self.close_connection = True
+            self._send(408, {"error": "Timed out reading the request body"})
+            return
+        if len(body) < length:
+            self.close_connection = True
+            self._send(400, {"error": "Request body shorter than its Content-Length"})
+            return
+        try:
+            jobs = self.server.service.submit(json.loads(body or b"null"))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self._send(400, {"error": f"Invalid JSON: {e}"})
+            return
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        self._send(202, {"jobs": [job.to_dict() for job in jobs]})
+
+    def _send(self, code, body):
+        data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) and self.client_address else "unix-socket"
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ThreadingHTTPServer's counterpart for a Unix domain socket."""
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+def create_server(service, host="127.0.0.1", port=8765, socket_path=None):
+    """Returns an HTTP server for `service`, on a Unix socket if `socket_path` is given and on host:port otherwise."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            # Refuse to take over the socket of a service that is still running.
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+                raise OSError(f"Another service is listening on {socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(socket_path)
+            finally:
+                probe.close()
+        server = UnixHTTPServer(socket_path, ServiceRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    server.service = service
+    return server
+
+def serve(args, initial_items=(), process=None):
+    """
+    Runs the analyzer as a long-lived service until interrupted: inputs are
+    submitted over the HTTP API and processed by `args.jobs` warm workers.
+    `initial_items` ((video_input, overrides) tuples) are queued at start.
+    """
+    service = AnalysisService(args, process)
+    try:
+        server = create_server(service, args.host, args.port, args.socket)
+    except OSError as e:
+        logging.critical(f"Could not start the service: {e}")
+        service.close()
+        return
+    if initial_items:
+        service.enqueue(initial_items)
+    address = args.socket or f"http://{args.host}:{server.server_port}"
+    logging.info(f"Service listening on {address} with {len(service.workers)} workers. Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Stopping service...")
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+        service.close()
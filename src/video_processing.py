@@ -1,15 +1,62 @@
 import os
 import cv2
+import numpy as np
 from tqdm import tqdm
 import hashlib
 import logging
 import re
 import subprocess
+import json
+import time
+import math
+import csv
+import tempfile
+import queue
+import threading
+import itertools
+import shutil
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from src import metrics
 
 import yt_dlp
 
 TEMP_DIR = "temp"
 
+# Read size for hashing: large reads keep the number of system calls low on multi-GB files.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Codecs that can be stream-copied into an MP4 container without re-encoding.
+MP4_VIDEO_CODECS = {"h264"}
+MP4_AUDIO_CODECS = {"aac", "mp3"}
+
+# Frame sampling strategies (see _iter_sampled_frames), and the sampling interval
+# (in seconds) at or above which 'auto' seeks rather than grabbing sequentially.
+SAMPLERS = ['auto', 'grab', 'seek']
+SEEK_MIN_INTERVAL_SEC = 5
+
+# Near-duplicate detection: dHash size (HASH_SIZE x HASH_SIZE bits), grayscale
+# histogram bins, and the histogram distance treated as a scene change.
+HASH_SIZE = 8
+HISTOGRAM_BINS = 32
+DEFAULT_SCENE_THRESHOLD = 0.35
+
+# Frame encoding: OpenCV's default JPEG quality, and the resolutions (longer
+# side, None = source) and qualities tried by plan_frame_encoding, best first.
+DEFAULT_JPEG_QUALITY = 95
+ENCODING_SIDE_LADDER = [None, 1536, 1024, 768, 512, 384]
+ENCODING_QUALITY_LADDER = [90, 75, 60]
+IMAGE_TOKENS_PER_TILE = 258
+
+# Frame extraction backends, and the read size for ffmpeg's MJPEG output stream.
+FRAME_BACKENDS = ['opencv', 'ffmpeg']
+FFMPEG_PIPE_CHUNK_SIZE = 1024 * 1024
+JPEG_END_MARKER = b'\xff\xd9'
+
+_END_OF_STREAM = object()
+
 def is_youtube_url(url):
     """Checks if the given string is a valid YouTube URL."""
     youtube_regex = (
@@ -18,17 +65,31 @@ def is_youtube_url(url):
         '(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})')
     return re.match(youtube_regex, url)
 
-def download_youtube_video(url):
+def youtube_video_id(url):
+    """
+    Returns a stable ID for a YouTube URL: the 11-character video ID matched by
+    is_youtube_url, or a hash of the URL for forms such as clips that do not
+    carry one. Returns None if the URL is not a YouTube URL.
+    """
+    match = is_youtube_url(url)
+    if not match:
+        return None
+    video_id = match.group(6)
+    if re.fullmatch(r'[A-Za-z0-9_-]{11}', video_id):
+        return video_id
+    return "url-" + hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+
+def download_youtube_video(url, output_dir=TEMP_DIR):
     """
-    Downloads a video from a YouTube URL using the yt-dlp library.
-    Returns the path to the downloaded file.
+    Downloads a video from a YouTube URL using the yt-dlp library into
+    `output_dir`. Returns the path to the downloaded file.
     """
-    if not os.path.exists(TEMP_DIR):
-        os.makedirs(TEMP_DIR)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
 
     logging.info(f"Attempting to download video from URL: {url} using yt-dlp library.")
 
-    output_template = os.path.join(TEMP_DIR, '%(title)s.%(ext)s')
+    output_template = os.path.join(output_dir, '%(title)s.%(ext)s')
 
     ydl_opts = {
         'outtmpl': output_template,
@@ -51,10 +112,51 @@ def download_youtube_video(url):
         logging.error(f"Failed to download video with yt-dlp library: {e}")
         return None
 
-def convert_to_mp4(video_path):
+def probe_streams(video_path):
+    """
+    Uses ffprobe to find the codecs of a file's first video and audio streams.
+    Returns a dict like {"video": "h264", "audio": "aac"} (None for a missing
+    stream), or None if the file could not be probed.
+    """
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_type,codec_name', '-of', 'json', video_path],
+            check=True,
+            capture_output=True
+        )
+        streams = json.loads(result.stdout).get("streams", [])
+    except (subprocess.CalledProcessError, FileNotFoundError, json.JSONDecodeError) as e:
+        logging.warning(f"ffprobe could not read {video_path}: {e}")
+        return None
+
+    codecs = {"video": None, "audio": None}
+    for stream in streams:
+        codec_type = stream.get("codec_type")
+        if codec_type in codecs and codecs[codec_type] is None:
+            codecs[codec_type] = stream.get("codec_name")
+    return codecs
+
+def _run_ffmpeg_conversion(video_path, output_path, video_codec, audio_codec, preset, threads):
+    """Runs one ffmpeg conversion, copying or re-encoding each stream as requested."""
+    command = ['ffmpeg', '-i', video_path, '-map', '0:v:0', '-map', '0:a:0?', '-c:v', video_codec, '-c:a', audio_codec]
+    if video_codec != 'copy':
+        command += ['-preset', preset]
+    command += ['-threads', str(threads), '-movflags', '+faststart', '-y', output_path]
+    subprocess.run(
+        command,
+        check=True,
+        capture_output=True # Suppress verbose ffmpeg output
+    )
+
+def convert_to_mp4(video_path, preset='medium', threads=0):
     """
     Converts a video file to a compatible MP4 format using ffmpeg.
     Deletes the original file upon successful conversion.
+
+    Streams that are already MP4-compatible (H.264 video, AAC/MP3 audio) are
+    stream-copied, so a webm/mkv that holds H.264/AAC is only remuxed. Other
+    streams are re-encoded to libx264/aac with the given x264 `preset` and
+    ffmpeg `threads` (0 = automatic).
     """
     if not video_path or not os.path.exists(video_path):
         logging.error(f"Cannot convert video: file not found at {video_path}")
@@ -65,15 +167,33 @@ def convert_to_mp4(video_path):
         return video_path
 
     output_path = os.path.splitext(video_path)[0] + ".mp4"
-    logging.info(f"Converting {os.path.basename(video_path)} to MP4 format...")
+    codecs = probe_streams(video_path) or {}
+    copy_video = codecs.get("video") in MP4_VIDEO_CODECS
+    copy_audio = codecs.get("audio") in MP4_AUDIO_CODECS or (codecs and codecs.get("audio") is None)
+    video_codec = 'copy' if copy_video else 'libx264'
+    audio_codec = 'copy' if copy_audio else 'aac'
+    conversion = {
+        (True, True): "remux", (True, False): "audio transcode",
+        (False, True): "video transcode", (False, False): "transcode",
+    }[(copy_video, bool(copy_audio))]
+    logging.info(
+        f"Converting {os.path.basename(video_path)} to MP4 format "
+        f"(video: {codecs.get('video', 'unknown')}, audio: {codecs.get('audio', 'unknown')}, path: {conversion})..."
+    )
 
+    start = time.monotonic()
     try:
-        subprocess.run(
-            ['ffmpeg', '-i', video_path, '-c:v', 'libx264', '-c:a', 'aac', '-y', output_path],
-            check=True,
-            capture_output=True # Suppress verbose ffmpeg output
-        )
-        logging.info(f"Successfully converted video to {output_path}")
+        try:
+            _run_ffmpeg_conversion(video_path, output_path, video_codec, audio_codec, preset, threads)
+        except subprocess.CalledProcessError as e:
+            if conversion == "transcode":
+                raise
+            # Retry anything that was stream-copied (video, audio or both) with a full transcode.
+            stderr_lines = e.stderr.decode().strip().splitlines()
+            logging.warning(f"Stream copy failed ({stderr_lines[-1] if stderr_lines else e}). Falling back to a full transcode.")
+            conversion = "transcode"
+            _run_ffmpeg_conversion(video_path, output_path, 'libx264', 'aac', preset, threads)
+        logging.info(f"Successfully converted video to {output_path} by {conversion} in {time.monotonic() - start:.1f}s.")
         
         # Clean up the original file
         try:
@@ -89,14 +209,117 @@ def convert_to_mp4(video_path):
             logging.error(f"ffmpeg stderr: {e.stderr.decode()}")
         return None
 
-def get_video_hash(video_path):
-    """Calculates the SHA256 hash of a video file for data integrity."""
-    sha256_hash = hashlib.sha256()
+def parse_time(value):
+    """Parses a time given as seconds ('90', '90.5') or as [HH:]MM:SS ('01:30') into seconds."""
+    parts = str(value).split(":")
+    if len(parts) > 3:
+        raise ValueError(f"Invalid time: {value}")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def check_time_range(start_sec, end_sec):
+    """Raises ValueError unless the times are non-negative and `end_sec` is after `start_sec` (or 0)."""
+    for name, value in (("start", start_sec), ("end", end_sec)):
+        if value is not None and value < 0:
+            raise ValueError(f"{name} time must not be negative (got {value})")
+    if end_sec is not None and end_sec <= (start_sec or 0):
+        raise ValueError(f"end time ({end_sec}s) must be after the start time ({start_sec or 0}s)")
+
+def make_scratch_dir(prefix, parent=TEMP_DIR):
+    """Creates a new uniquely named directory under `parent` (the temporary directory by default)."""
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=parent)
+
+def trim_video(video_path, start_sec=None, end_sec=None, output_dir=None):
+    """
+    Cuts a time range out of a video with ffmpeg stream copy (no re-encoding).
+    Because stream copy cuts on keyframes, the clip may begin slightly before
+    `start_sec`. Returns the path to the clip, or None on failure.
+    """
+    output_dir = output_dir or make_scratch_dir("trim-")
+    output_path = os.path.join(output_dir, os.path.basename(os.path.splitext(video_path)[0]) + ".mp4")
+    command = ['ffmpeg']
+    if start_sec is not None:
+        command += ['-ss', str(start_sec)]
+    if end_sec is not None:
+        command += ['-to', str(end_sec)]
+    command += ['-i', video_path, '-c', 'copy', '-map', '0', '-avoid_negative_ts', 'make_zero', '-y', output_path]
+
+    logging.info(f"Trimming {os.path.basename(video_path)} to {start_sec or 0}s-{end_sec if end_sec is not None else 'end'}...")
     try:
-        with open(video_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
+        subprocess.run(command, check=True, capture_output=True)
+        return output_path
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        logging.error(f"ffmpeg trimming failed: {e}")
+        if isinstance(e, subprocess.CalledProcessError):
+            logging.error(f"ffmpeg stderr: {e.stderr.decode()}")
+        return None
+
+def split_video_segments(video_path, segment_sec, output_dir=None):
+    """
+    Splits a video into consecutive segments of about `segment_sec` seconds with
+    ffmpeg stream copy. Segments are cut on keyframes, so their actual bounds
+    are read back from ffmpeg's segment list. Returns a list of
+    (segment_path, start_sec, end_sec) tuples, or None on failure.
+    """
+    output_dir = output_dir or make_scratch_dir("segments-")
+    list_path = os.path.join(output_dir, "segments.csv")
+    command = [
+        'ffmpeg', '-i', video_path, '-c', 'copy', '-map', '0',
+        '-f', 'segment', '-segment_time', str(segment_sec), '-reset_timestamps', '1',
+        '-segment_list', list_path, '-segment_list_type', 'csv',
+        '-y', os.path.join(output_dir, 'segment%04d.mp4')
+    ]
+
+    logging.info(f"Splitting {os.path.basename(video_path)} into {segment_sec}s segments...")
+    try:
+        subprocess.run(command, check=True, capture_output=True)
+        with open(list_path, newline="") as f:
+            segments = [
+                (os.path.join(output_dir, row[0]), float(row[1]), float(row[2]))
+                for row in csv.reader(f) if row
+            ]
+        logging.info(f"Split {os.path.basename(video_path)} into {len(segments)} segments.")
+        return segments
+    except (subprocess.CalledProcessError, FileNotFoundError, OSError, ValueError, IndexError) as e:
+        logging.error(f"ffmpeg segmenting failed: {e}")
+        if isinstance(e, subprocess.CalledProcessError):
+            logging.error(f"ffmpeg stderr: {e.stderr.decode()}")
+        return None
+
+def _sha256_file(video_path):
+    """Hashes a file with large unbuffered reads; the digest runs without holding the GIL."""
+    with open(video_path, "rb", buffering=0) as f:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        sha256_hash = hashlib.sha256()
+        buffer = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buffer)
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            sha256_hash.update(view[:size])
         return sha256_hash.hexdigest()
+
+def get_video_hash(video_path, hash_cache=None):
+    """
+    Calculates the SHA256 hash of a video file for data integrity.
+
+    If a HashCache is given, a hash recorded for the same path, size,
+    modification time and inode is reused instead of reading the file again.
+    """
+    try:
+        if hash_cache:
+            cached_hash = hash_cache.get(video_path)
+            if cached_hash:
+                return cached_hash
+        video_hash = _sha256_file(video_path)
+        if hash_cache:
+            hash_cache.put(video_path, video_hash)
+        return video_hash
     except FileNotFoundError:
         logging.error(f"Could not find file {video_path} to calculate hash.")
         return None
@@ -104,8 +327,352 @@ def get_video_hash(video_path):
         logging.error(f"Error calculating hash for {video_path}: {e}")
         return None
 
-def extract_frames(video_path, interval_sec=1):
-    """Extracts frames from a video file at a given interval."""
+def _grab_sampled_frames(cap, frame_interval, start_frame=0, end_frame=None, position=0):
+    """
+    Sequential sampler: advances with cap.grab() from frame `position` and only calls
+    cap.retrieve() on the sampled frames, so skipped frames are never converted to BGR.
+    """
+    frame_index = position
+    if start_frame > position and cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame):
+        frame_index = start_frame
+    while end_frame is None or frame_index < end_frame:
+        if not cap.grab():
+            break
+        if frame_index >= start_frame and (frame_index - start_frame) % frame_interval == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            yield frame_index, frame
+        frame_index += 1
+
+def _iter_sampled_frames(cap, frame_interval, total_frames, sampler, start_frame=0, end_frame=None):
+    """
+    Yields (frame_index, frame) for every `frame_interval`-th frame of an open capture
+    between `start_frame` (inclusive) and `end_frame` (exclusive, default: the end).
+
+    The 'grab' sampler walks the video but only decodes the sampled frames to images.
+    The 'seek' sampler jumps straight to each sampled frame, which lets the decoder
+    skip whole GOPs when the interval is long.
+    """
+    if total_frames > 0:
+        end_frame = total_frames if end_frame is None else min(end_frame, total_frames)
+
+    if sampler == 'seek' and total_frames > 0:
+        position = 0
+        for frame_index in range(start_frame, end_frame, frame_interval):
+            if frame_index != position and not cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index):
+                logging.warning("Seeking is not supported for this video. Falling back to sequential sampling.")
+                yield from _grab_sampled_frames(cap, frame_interval, frame_index, end_frame, position)
+                return
+            ret, frame = cap.read()
+            if not ret:
+                break
+            position = frame_index + 1
+            yield frame_index, frame
+        return
+
+    yield from _grab_sampled_frames(cap, frame_interval, start_frame, end_frame)
+
+def _choose_sampler(sampler, interval_sec):
+    """Resolves the 'auto' sampler to a concrete strategy."""
+    if sampler != 'auto':
+        return sampler
+    return 'seek' if interval_sec >= SEEK_MIN_INTERVAL_SEC else 'grab'
+
+def frame_signature(frame):
+    """
+    Computes a cheap visual signature of a BGR frame for near-duplicate detection.
+
+    Returns a tuple of the frame's difference hash (a boolean array comparing
+    adjacent pixels of a tiny grayscale thumbnail) and its normalized grayscale
+    histogram.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    dhash = thumbnail[:, 1:] > thumbnail[:, :-1]
+    small = cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA)
+    histogram = np.bincount(small.ravel() >> 3, minlength=HISTOGRAM_BINS).astype(np.float32)
+    return dhash, histogram / histogram.sum()
+
+def signature_distance(a, b):
+    """
+    Returns (hash_distance, histogram_distance) between two frame signatures:
+    the number of differing dHash bits and the total variation distance (0-1)
+    between their histograms.
+    """
+    hash_distance = int(np.count_nonzero(a[0] != b[0]))
+    histogram_distance = float(np.abs(a[1] - b[1]).sum() / 2)
+    return hash_distance, histogram_distance
+
+def encode_frame(frame, max_side=None, jpeg_quality=DEFAULT_JPEG_QUALITY):
+    """Downscales a BGR frame so its longer side is at most `max_side` and JPEG-encodes it."""
+    if max_side:
+        height, width = frame.shape[:2]
+        scale = max_side / max(height, width)
+        if scale < 1:
+            frame = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)])
+    return buffer
+
+def estimate_image_tokens(width, height):
+    """
+    Estimates the Gemini input tokens for one image: 258 tokens if both sides are
+    at most 384 pixels, otherwise 258 tokens per 768x768 tile.
+    """
+    if width <= 384 and height <= 384:
+        return IMAGE_TOKENS_PER_TILE
+    return math.ceil(width / 768) * math.ceil(height / 768) * IMAGE_TOKENS_PER_TILE
+
+def _scaled_size(width, height, max_side):
+    """Returns the (width, height) of a frame after encode_frame's downscaling."""
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def plan_frame_encoding(video_path, interval_sec=1, max_bytes=None, max_tokens=None, window_sec=0, start_sec=None, end_sec=None):
+    """
+    Chooses the frame resolution, JPEG quality and, if necessary, a longer
+    sampling interval so that each Gemini request fits the given budget.
+
+    The budget is per request: the whole video in single-request mode, or one
+    window of `window_sec` seconds in windowed mode, optionally restricted to
+    the `start_sec`-`end_sec` range. Encoded sizes are measured
+    by encoding a few probe frames at each candidate setting. Returns a dict
+    describing the chosen settings and estimates, or None if the video cannot
+    be read.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        logging.error(f"Could not open video file {video_path}")
+        return None
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    probes = []
+    for fraction in (0.25, 0.5, 0.75):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(total_frames * fraction))
+        ret, frame = cap.read()
+        if ret:
+            probes.append(frame)
+    cap.release()
+    if not probes:
+        logging.error(f"Could not read probe frames from {video_path}")
+        return None
+
+    duration = min(end_sec if end_sec is not None else total_frames / fps, total_frames / fps) - (start_sec or 0)
+    request_duration = min(window_sec, duration) if window_sec else duration
+
+    def frames_per_request(interval):
+        return max(1, math.ceil(request_duration / interval))
+
+    candidates = []
+    for max_side in ENCODING_SIDE_LADDER:
+        if max_side and max_side >= max(width, height):
+            continue
+        scaled_width, scaled_height = _scaled_size(width, height, max_side)
+        for quality in ENCODING_QUALITY_LADDER:
+            bytes_per_frame = sum(len(encode_frame(frame, max_side, quality)) for frame in probes) / len(probes)
+            candidates.append({
+                "max_side": max_side,
+                "jpeg_quality": quality,
+                "frame_size": [scaled_width, scaled_height],
+                "estimated_bytes_per_frame": int(bytes_per_frame),
+                "estimated_tokens_per_frame": estimate_image_tokens(scaled_width, scaled_height),
+            })
+
+    def overshoot(candidate, interval):
+        n = frames_per_request(interval)
+        ratios = [1.0]
+        if max_bytes:
+            ratios.append(n * candidate["estimated_bytes_per_frame"] / max_bytes)
+        if max_tokens:
+            ratios.append(n * candidate["estimated_tokens_per_frame"] / max_tokens)
+        return max(ratios)
+
+    chosen = next((c for c in candidates if overshoot(c, interval_sec) <= 1.0), None)
+    planned_interval = interval_sec
+    if chosen is None:
+        chosen = min(candidates, key=lambda c: overshoot(c, interval_sec))
+        planned_interval = round(interval_sec * overshoot(chosen, interval_sec) + 0.05, 1)
+        while overshoot(chosen, planned_interval) > 1.0 and planned_interval < request_duration:
+            planned_interval = round(planned_interval * 1.1 + 0.1, 1)
+        logging.warning(
+            f"Even the smallest encoding exceeds the request budget at a {interval_sec}s interval. "
+            f"Increasing the sampling interval to {planned_interval}s."
+        )
+
+    plan = dict(chosen)
+    n = frames_per_request(planned_interval)
+    plan.update({
+        "interval": planned_interval,
+        "source_size": [width, height],
+        "estimated_frames_per_request": n,
+        "estimated_bytes_per_request": n * chosen["estimated_bytes_per_frame"],
+        "estimated_tokens_per_request": n * chosen["estimated_tokens_per_frame"],
+        "budget": {"max_bytes": max_bytes, "max_tokens": max_tokens, "window": window_sec},
+    })
+    logging.info(
+        f"Encoding plan for {os.path.basename(video_path)}: {plan['frame_size'][0]}x{plan['frame_size'][1]} "
+        f"at JPEG quality {plan['jpeg_quality']}, one frame every {planned_interval}s "
+        f"(~{plan['estimated_bytes_per_request'] / 1e6:.1f} MB, ~{plan['estimated_tokens_per_request']} image tokens per request)."
+    )
+    return plan
+
+def _split_frame_range(start_frame, end_frame, frame_interval, workers):
+    """
+    Splits [start_frame, end_frame) into consecutive chunks whose boundaries fall
+    on sampled frames, about four chunks per worker so the pool stays busy.
+    """
+    samples = max(1, math.ceil((end_frame - start_frame) / frame_interval))
+    samples_per_chunk = max(1, math.ceil(samples / (workers * 4)))
+    chunk_frames = samples_per_chunk * frame_interval
+    return [(chunk_start, min(chunk_start + chunk_frames, end_frame)) for chunk_start in range(start_frame, end_frame, chunk_frames)]
+
+def _init_extract_worker():
+    """Process pool initializer: one OpenCV thread per process, since parallelism comes from the pool."""
+    cv2.setNumThreads(1)
+
+def _extract_range(video_path, start_frame, end_frame, frame_interval, sampler, max_side, jpeg_quality, with_signatures):
+    """
+    Process pool task: samples one frame range with its own capture handle.
+    Returns a list of (frame_index, jpeg_bytes, signature) tuples.
+    """
+    cap = cv2.VideoCapture(video_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    results = []
+    try:
+        for frame_index, frame in _iter_sampled_frames(cap, frame_interval, total_frames, sampler, start_frame, end_frame):
+            signature = frame_signature(frame) if with_signatures else None
+            results.append((frame_index, encode_frame(frame, max_side, jpeg_quality).tobytes(), signature))
+    finally:
+        cap.release()
+    return results
+
+def _iter_parallel_ranges(video_path, ranges, frame_interval, sampler, max_side, jpeg_quality, with_signatures, workers):
+    """
+    Runs _extract_range over `ranges` in a process pool and yields the frames in
+    order. At most two chunks per worker are in flight, bounding memory use.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_extract_worker) as executor:
+        pending = deque()
+        remaining = iter(ranges)
+        for chunk_start, chunk_end in itertools.islice(remaining, workers * 2):
+            pending.append(executor.submit(
+                _extract_range, video_path, chunk_start, chunk_end, frame_interval, sampler, max_side, jpeg_quality, with_signatures
+            ))
+        try:
+            while pending:
+                chunk = pending.popleft().result()
+                for chunk_start, chunk_end in itertools.islice(remaining, 1):
+                    pending.append(executor.submit(
+                        _extract_range, video_path, chunk_start, chunk_end, frame_interval, sampler, max_side, jpeg_quality, with_signatures
+                    ))
+                yield from chunk
+        finally:
+            for future in pending:
+                future.cancel()
+
+def ffmpeg_available():
+    """Returns True if an ffmpeg executable is on the PATH."""
+    return shutil.which('ffmpeg') is not None
+
+def _ffmpeg_jpeg_qscale(jpeg_quality):
+    """Maps a 1-100 JPEG quality to ffmpeg's MJPEG -q:v scale (2 = best, 31 = worst)."""
+    return round(2 + (100 - min(max(int(jpeg_quality), 1), 100)) * 29 / 99)
+
+def _iter_ffmpeg_frames(video_path, frame_interval, start_frame, end_frame, size, jpeg_quality, fps):
+    """
+    Yields (frame_index, jpeg_bytes) for every `frame_interval`-th frame between
+    `start_frame` and `end_frame`, decoded, scaled to `size` and JPEG-encoded by
+    ffmpeg (with its own threads) and read from an MJPEG image2pipe stream.
+
+    Python only sees the encoded bytes, never decoded frames. ffmpeg seeks to
+    `start_frame` (at `fps`) before decoding, so the frames before the range are
+    not decoded, and frames are then selected by their index from that point,
+    so the sampled frames match the OpenCV samplers. Raises RuntimeError if
+    ffmpeg exits with an error, since the frames yielded up to that point may be
+    incomplete.
+    """
+    select = f"not(mod(n\\,{frame_interval}))"
+    if end_frame is not None:
+        select += f"*lt(n\\,{end_frame - start_frame})"
+    filters = [f"select={select}"]
+    if size:
+        filters.append(f"scale={size[0]}:{size[1]}:flags=area")
+    command = ['ffmpeg', '-nostdin', '-loglevel', 'error']
+    if start_frame > 0:
+        # Input seeking is frame-accurate when decoding. Seeking half a frame early
+        # keeps float rounding from skipping the start frame itself.
+        command += ['-ss', f"{(start_frame - 0.5) / fps:.6f}"]
+    # -vsync rather than -fps_mode, which only exists in ffmpeg 5.1 and later.
+    command += ['-i', video_path, '-map', '0:v:0', '-vf', ','.join(filters), '-vsync', 'passthrough']
+    if end_frame is not None:
+        # Stops ffmpeg after the last sampled frame instead of decoding to the end.
+        command += ['-frames:v', str(max(0, math.ceil((end_frame - start_frame) / frame_interval)))]
+    command += ['-f', 'image2pipe', '-c:v', 'mjpeg', '-pix_fmt', 'yuvj420p', '-q:v', str(_ffmpeg_jpeg_qscale(jpeg_quality)), '-']
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    frame_index = start_frame
+    pending = bytearray()
+    try:
+        while chunk := process.stdout.read(FFMPEG_PIPE_CHUNK_SIZE):
+            # Only the last byte of the previous data can start a marker split across chunks.
+            search_from = max(0, len(pending) - 1)
+            pending += chunk
+            frame_start = 0
+            # ffmpeg's MJPEG frames carry no embedded thumbnails, so the first
+            # end-of-image marker always closes the current frame.
+            while (end := pending.find(JPEG_END_MARKER, search_from)) >= 0:
+                end += len(JPEG_END_MARKER)
+                yield frame_index, bytes(pending[frame_start:end])
+                frame_index += frame_interval
+                frame_start = search_from = end
+            # Drop the yielded frames once per chunk rather than once per frame.
+            del pending[:frame_start]
+        process.wait()
+        if process.returncode != 0:
+            error_lines = process.stderr.read().decode(errors='replace').strip().splitlines()
+            raise RuntimeError(f"ffmpeg frame extraction failed: {error_lines[-1] if error_lines else process.returncode}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+def _decoded_signature(jpeg):
+    """Computes frame_signature from encoded JPEG bytes, decoding at reduced size."""
+    return frame_signature(cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_REDUCED_COLOR_4))
+
+def iter_frames(video_path, interval_sec=1, sampler='auto', dedup_threshold=None, scene_threshold=DEFAULT_SCENE_THRESHOLD,
+                stats=None, max_side=None, jpeg_quality=DEFAULT_JPEG_QUALITY, start_sec=None, end_sec=None, workers=1, backend='opencv'):
+    """
+    Opens a video and returns a generator of (timestamp_sec, jpeg_bytes) tuples.
+
+    Frames are decoded and encoded lazily, one at a time, so memory does not grow
+    with the length of the video. Returns None if the video cannot be opened.
+
+    If `dedup_threshold` is set, sampled frames whose difference hash is within
+    that many bits of the last kept frame are dropped, unless their histogram
+    distance exceeds `scene_threshold` (a scene change). If a `stats` dict is
+    given, it is filled with the sampled/kept counts and the kept timestamps.
+
+    Kept frames are downscaled so that their longer side is at most `max_side`
+    pixels (if set) and encoded at `jpeg_quality`. `start_sec` and `end_sec`
+    restrict sampling to a time range; timestamps stay on the original timeline.
+
+    With `workers` > 1, the range is split into chunks that are decoded and
+    encoded in a process pool (see _extract_range) and yielded in timestamp
+    order, producing the same frames as the serial path.
+
+    The 'ffmpeg' backend has ffmpeg select, scale and JPEG-encode the frames
+    (see _iter_ffmpeg_frames) and falls back to OpenCV if ffmpeg is not installed.
+    """
     if not os.path.exists(video_path):
         logging.error(f"Video file not found at {video_path}")
         return None
@@ -119,27 +686,173 @@ def extract_frames(video_path, interval_sec=1):
     if fps == 0:
         logging.warning(f"Could not determine FPS for {video_path}. Using a default of 30.")
         fps = 30
-        
-    frame_interval = int(fps * interval_sec)
-    frames = []
-    frame_count = 0
-    
+
+    frame_interval = max(1, int(fps * interval_sec))
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    
-    logging.info(f"Extracting frames from {os.path.basename(video_path)}...")
-    with tqdm(total=total_frames, unit='frames', leave=False) as pbar:
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
+    sampler = _choose_sampler(sampler, interval_sec)
+    start_frame = int(round(start_sec * fps)) if start_sec is not None else 0
+    end_frame = int(round(end_sec * fps)) if end_sec is not None else None
+
+    if backend == 'ffmpeg' and not ffmpeg_available():
+        logging.warning("ffmpeg was not found. Falling back to the OpenCV frame backend.")
+        backend = 'opencv'
+
+    frame_stats = stats if stats is not None else {}
+    frame_stats.update({"sampled": 0, "kept": 0, "scene_changes": 0, "kept_timestamps": []})
+
+    with_signatures = dedup_threshold is not None
+
+    def sample():
+        """Yields (frame_index, signature, encode) for each sampled frame, where encode() returns its JPEG bytes."""
+        if backend == 'ffmpeg':
+            size = None
+            if max_side:
+                width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                if width and height and max(width, height) > max_side:
+                    size = _scaled_size(width, height, max_side)
+            stop_frame = end_frame
+            if total_frames > 0:
+                stop_frame = min(end_frame if end_frame is not None else total_frames, total_frames)
+            yielded = 0
+            try:
+                for frame_index, jpeg in _iter_ffmpeg_frames(video_path, frame_interval, start_frame, stop_frame, size, jpeg_quality, fps):
+                    signature = _decoded_signature(jpeg) if with_signatures else None
+                    yielded += 1
+                    yield frame_index, signature, lambda jpeg=jpeg: jpeg
+                return
+            except RuntimeError as e:
+                if yielded:
+                    raise
+                # Nothing was produced yet (e.g. an ffmpeg build that rejects an
+                # option), so the OpenCV path can still deliver every frame.
+                logging.warning(f"{e}. Falling back to the OpenCV frame backend.")
+        if workers > 1 and total_frames > 0:
+            cap.release()
+            ranges = _split_frame_range(start_frame, min(end_frame or total_frames, total_frames), frame_interval, workers)
+            for frame_index, jpeg, signature in _iter_parallel_ranges(
+                video_path, ranges, frame_interval, sampler, max_side, jpeg_quality, with_signatures, workers
+            ):
+                yield frame_index, signature, lambda jpeg=jpeg: jpeg
+            return
+        for frame_index, frame in _iter_sampled_frames(cap, frame_interval, total_frames, sampler, start_frame, end_frame):
+            signature = frame_signature(frame) if with_signatures else None
+            yield frame_index, signature, lambda frame=frame: encode_frame(frame, max_side, jpeg_quality).tobytes()
+
+    def generate():
+        video_name = os.path.basename(video_path)
+        last_signature = None
+        if backend == 'ffmpeg':
+            method = "ffmpeg"
+        elif workers > 1:
+            method = f"{workers} worker processes"
+        else:
+            method = f"the '{sampler}' sampler"
+        logging.info(f"Extracting frames from {video_name} using {method}...")
+        # Time spent inside this generator (not waiting for the consumer),
+        # split into sampling/decoding and JPEG encoding for the stage metrics.
+        busy_seconds = encode_seconds = 0.0
+        encoded_bytes = 0
+        resumed = time.monotonic()
+        try:
+            with tqdm(initial=start_frame, total=end_frame or total_frames, unit='frames', leave=False) as pbar:
+                for frame_index, signature, encode in sample():
+                    pbar.update(frame_index + 1 - pbar.n)
+                    frame_stats["sampled"] += 1
+                    if with_signatures:
+                        if last_signature is not None:
+                            hash_distance, histogram_distance = signature_distance(signature, last_signature)
+                            if histogram_distance > scene_threshold:
+                                frame_stats["scene_changes"] += 1
+                            elif hash_distance <= dedup_threshold:
+                                continue
+                        last_signature = signature
+
+                    timestamp = frame_index / fps
+                    frame_stats["kept"] += 1
+                    frame_stats["kept_timestamps"].append(round(timestamp, 3))
+                    encode_started = time.monotonic()
+                    jpeg = encode()
+                    encode_seconds += time.monotonic() - encode_started
+                    encoded_bytes += len(jpeg)
+                    busy_seconds += time.monotonic() - resumed
+                    yield timestamp, jpeg
+                    resumed = time.monotonic()
+        finally:
+            cap.release()
+            busy_seconds += time.monotonic() - resumed
+            metrics.record_span("extract", busy_seconds - encode_seconds, frames=frame_stats["sampled"], backend=backend, workers=workers)
+            metrics.record_span("encode", encode_seconds, frames=frame_stats["kept"], bytes=encoded_bytes)
+        if dedup_threshold is not None and frame_stats["sampled"]:
+            dropped = frame_stats["sampled"] - frame_stats["kept"]
+            logging.info(
+                f"Deduplication kept {frame_stats['kept']} of {frame_stats['sampled']} sampled frames from {video_name} "
+                f"({dropped / frame_stats['sampled']:.1%} dropped, {frame_stats['scene_changes']} scene changes)."
+            )
+        logging.info(f"Extracted {frame_stats['kept']} frames from {video_name}.")
+
+    return generate()
+
+def prefetch(iterable, max_in_flight):
+    """
+    Runs `iterable` in a background thread, keeping at most `max_in_flight` items
+    buffered ahead of the consumer.
+
+    This lets frame decoding and encoding overlap with request assembly while
+    bounding how many encoded frames are held in memory at once. A value of 0
+    disables prefetching and iterates inline.
+    """
+    if max_in_flight <= 0:
+        yield from iterable
+        return
+
+    buffer = queue.Queue(maxsize=max_in_flight)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((False, item)):
+                    break
+        except Exception as e:
+            put((True, e))
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+            put(_END_OF_STREAM)
+
+    thread = threading.Thread(target=metrics.propagate(produce), name="frame-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            entry = buffer.get()
+            if entry is _END_OF_STREAM:
                 break
-            
-            if frame_count % frame_interval == 0:
-                _, buffer = cv2.imencode('.jpg', frame)
-                frames.append(buffer.tobytes())
-            
-            frame_count += 1
-            pbar.update(1)
+            failed, item = entry
+            if failed:
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
 
-    cap.release()
-    logging.info(f"Extracted {len(frames)} frames from {os.path.basename(video_path)}.")
-    return frames
\ No newline at end of file
+def extract_frames(video_path, interval_sec=1, sampler='auto'):
+    """
+    Extracts frames from a video file at a given interval.
+
+    Only the sampled frames are decoded to images; see _iter_sampled_frames for the
+    available sampling strategies ('grab', 'seek' or 'auto'). Prefer iter_frames
+    for long videos, as this collects every encoded frame into a list.
+    """
+    frames = iter_frames(video_path, interval_sec, sampler)
+    if frames is None:
+        return None
+    return [jpeg for _, jpeg in frames]